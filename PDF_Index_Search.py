@@ -1,95 +1,178 @@
-import json
-import streamlit as st
-from PIL import Image
-import re
-import os
-
-def get_index_path(path):
-    """Smartly resolve the index.json path, whether given a folder or a file path."""
-    path = os.path.abspath(path)
-    if path.lower().endswith('.json') and os.path.isfile(path):
-        return path
-    if os.path.isdir(path):
-        return os.path.join(path, "index.json")
-    if path.lower().endswith('.json'):  # allow for new json (not exist yet)
-        return path
-    raise ValueError(f"Path is neither a .json file nor a valid directory: {path}")
-
-def highlight(text, keyword):
-    if not keyword.strip():
-        return text
-    pattern = re.compile(re.escape(keyword), re.IGNORECASE)
-    return pattern.sub(lambda m: f'<mark style="background: #fff799">{m.group(0)}</mark>', text)
-
-def display_name(item):
-    m = re.search(r'page_(\d+)', item['filename'])
-    page = m.group(1).lstrip("0") if m else "?"
-    short_text = item["text"].strip().replace("\n", " ")[:60]
-    return f"Picture | {short_text}..."
-
-def run():
-    st.set_page_config(page_title="PDF_Index_Search", layout="wide")
-    st.title("📷 PDF_Index_Search")
-
-    # Default input_path
-    input_path = "E:/PDF_Files/index_image.json"
-    index_path = get_index_path(input_path)
-    folder = os.path.dirname(index_path)
-
-    index_data = []
-    if os.path.exists(index_path):
-        with open(index_path, "r", encoding="utf-8") as f:
-            index_data = json.load(f)
-    else:
-        st.warning("Cannot find index.json in this folder. Please run the OCR script first.")
-
-    # --- Giao diện tìm kiếm & Gallery ---
-    if index_data:
-        if 'clicked_idx' not in st.session_state:
-            st.session_state['clicked_idx'] = None
-        if 'keyword' not in st.session_state:
-            st.session_state['keyword'] = ''
-
-        keyword = st.text_input("🔎 Search keyword", value=st.session_state.get('keyword', ''))
-        if keyword:
-            # Lọc các ảnh còn tồn tại thật sự trên ổ cứng
-            filtered_results = []
-            for item in index_data:
-                if keyword.lower() in item['text'].lower():
-                    img_path = os.path.join(folder, item["filename"])
-                    if os.path.exists(img_path):
-                        filtered_results.append(item)
-            results = filtered_results
-
-            st.write(f"Found **{len(results)}** image(s) containing keyword: `{keyword}`")
-            if len(results) == 0:
-                st.info("No images found.")
-            else:
-                cols = st.columns(5)
-                for idx, item in enumerate(results):
-                    img_path = os.path.join(folder, item["filename"])
-                    with cols[idx % 5]:
-                        if st.button("", key=f"img-btn-{idx}"):
-                            st.session_state['clicked_idx'] = idx
-                            st.session_state['keyword'] = keyword
-                        st.image(img_path, use_container_width=True, caption=f"{item['filename'][:40]}")
-                clicked_idx = st.session_state.get('clicked_idx', None)
-                if clicked_idx is not None and clicked_idx < len(results):
-                    img_item = results[clicked_idx]
-                    img_path = os.path.join(folder, img_item["filename"])
-                    st.subheader(f"Detail view: {img_item['filename']}")
-                    st.image(img_path, use_container_width=True)
-                    highlighted = highlight(img_item["text"][:2000], keyword)
-                    st.markdown(highlighted, unsafe_allow_html=True)
-                    if st.button("Clear selection"):
-                        st.session_state['clicked_idx'] = None
-
-    # --- FOOTER ---
-    st.markdown("""<br><hr><div style='text-align:center; font-size: 12px'>
-    | Copyright 2025 | 🧠 Nghiên Cứu Thuốc | PharmApp |<br>
-    | Discover | Design | Optimize | Create | Deliver | <br>
-    | www.nghiencuuthuoc.com | Zalo: +84888999311 | www.pharmapp.vn |
-    </div>""", unsafe_allow_html=True)
-
-if __name__ == "__main__":
-    run()
+import streamlit as st
+import re
+import os
+from pdf_index_log import IndexLogger
+from pdf_index_querylog import (PhaseTimer, existing_hits, log_query, query_mode, search_loaded,
+                                slow_log_path)
+from pdf_index_store import IndexFormatError, file_stamp, load_index, read_header
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")
+
+def get_index_path(path):
+    """Smartly resolve the index.json path, whether given a folder or a file path."""
+    path = os.path.abspath(path)
+    if path.lower().endswith('.json') and os.path.isfile(path):
+        return path
+    if os.path.isdir(path):
+        return os.path.join(path, "index.json")
+    if path.lower().endswith('.json'):  # allow for new json (not exist yet)
+        return path
+    raise ValueError(f"Path is neither a .json file nor a valid directory: {path}")
+
+def highlight(text, keyword):
+    if not keyword.strip():
+        return text
+    pattern = re.compile(re.escape(keyword), re.IGNORECASE)
+    return pattern.sub(lambda m: f'<mark style="background: #fff799">{m.group(0)}</mark>', text)
+
+def display_name(item):
+    page = item["page"] or "?"
+    short_text = item["text"].strip().replace("\n", " ")[:60]
+    kind = "Picture" if item["filename"].lower().endswith(IMAGE_EXTS) else f"p.{page}"
+    return f"{kind} | {short_text}..."
+
+@st.cache_resource(show_spinner="Loading index...", max_entries=2)
+def cached_index(index_path, stamp):
+    # stamp (size, mtime_ns) là cache key → tự nạp lại khi indexer ghi index mới; chỉ giữ 2 bản gần nhất
+    index = load_index(index_path)
+    if file_stamp(index_path) != stamp:
+        raise IndexFormatError("index.json was replaced while loading; search again")  # lỗi không bị cache
+    return index
+
+@st.cache_resource(show_spinner="Loading section index...")
+def cached_fields(fields_path, mtime):
+    from pdf_index_fields import open_field_index
+    return open_field_index(fields_path)
+
+@st.cache_resource(show_spinner="Loading semantic index...")
+def cached_semantic(index_path, mtime):
+    from pdf_index_semantic import SemanticIndex  # numpy/model chỉ nạp khi bật semantic
+    return SemanticIndex(index_path)
+
+@st.cache_resource
+def slow_query_logger(log_path):
+    # Một logger (thread ghi nền) dùng chung cho cả tiến trình Streamlit
+    return IndexLogger(log_path, fmt="jsonl", max_bytes=2 * 1024 * 1024)
+
+def show_timings(timer, logged):
+    st.sidebar.markdown("**⏱️ Last search**")
+    st.sidebar.table({"phase": list(timer.phases), "ms": [f"{ms:.1f}" for ms in timer.phases.values()]})
+    st.sidebar.caption(f"Total {timer.total:.0f} ms" + (" · written to the slow-query log" if logged else ""))
+
+def show_results(results, keyword, folder, found):
+    st.write(f"Found **{len(results)}** {found}: `{keyword}`")
+    if len(results) == 0:
+        st.info("No pages found.")
+    else:
+        cols = st.columns(5)
+        for idx, item in enumerate(results):
+            img_path = os.path.join(folder, item["filename"])
+            with cols[idx % 5]:
+                if st.button(display_name(item), key=f"img-btn-{idx}"):
+                    st.session_state['clicked_idx'] = idx
+                    st.session_state['keyword'] = keyword
+                if item["filename"].lower().endswith(IMAGE_EXTS):
+                    st.image(img_path, use_container_width=True, caption=f"{item['filename'][:40]}")
+                else:
+                    st.caption(item["filename"][:40])
+        clicked_idx = st.session_state.get('clicked_idx', None)
+        if clicked_idx is not None and clicked_idx < len(results):
+            img_item = results[clicked_idx]
+            img_path = os.path.join(folder, img_item["filename"])
+            st.subheader(f"Detail view: {img_item['filename']} (page {img_item['page'] or '?'})")
+            if img_item["filename"].lower().endswith(IMAGE_EXTS):
+                st.image(img_path, use_container_width=True)
+            highlighted = highlight(img_item["text"][:2000], keyword)
+            st.markdown(highlighted, unsafe_allow_html=True)
+            if st.button("Clear selection"):
+                st.session_state['clicked_idx'] = None
+
+def run():
+    st.set_page_config(page_title="PDF_Index_Search", layout="wide")
+    st.title("📷 PDF_Index_Search")
+
+    # Default input_path
+    input_path = "E:/PDF_Files/index_image.json"
+    index_path = get_index_path(input_path)
+    folder = os.path.dirname(index_path)
+
+    # Header nhỏ → hiện thống kê ngay; index.json chỉ được nạp ở lần tìm kiếm đầu tiên
+    index_exists = os.path.exists(index_path)
+    if index_exists:
+        header = read_header(index_path)
+        if header:
+            st.caption(f"{header['documents']} documents · {header['pages']} pages · index version {header['version']}")
+        # Phiên làm việc giữ bản index đã nạp ở lần tìm đầu tiên (snapshot, kể cả khi cache đã bỏ nó)
+        # tới khi người dùng chọn nạp bản mới → kết quả không đổi giữa chừng khi indexer ghi index.json
+        latest = file_stamp(index_path)
+        snapshot = st.session_state.get('index_snapshot')  # (stamp, PdfIndex) hoặc None
+        if snapshot is not None and snapshot[0] != latest:
+            st.info("A newer index was saved while you were searching.")
+            if st.button("🔄 Load new index"):
+                st.session_state['index_snapshot'] = snapshot = None
+    else:
+        st.warning("Cannot find index.json in this folder. Please run the OCR script first.")
+
+    # --- Giao diện tìm kiếm & Gallery ---
+    if index_exists:
+        if 'clicked_idx' not in st.session_state:
+            st.session_state['clicked_idx'] = None
+        if 'keyword' not in st.session_state:
+            st.session_state['keyword'] = ''
+
+        keyword = st.text_input("🔎 Search keyword", value=st.session_state.get('keyword', ''))
+        debug = st.sidebar.checkbox("⏱️ Show search timings")
+        # Semantic (hybrid) chỉ hiện khi đã chạy: python pdf_index_semantic.py build
+        embeddings = os.path.splitext(index_path)[0] + ".embeddings.npz"
+        semantic_on = os.path.exists(embeddings) and st.checkbox("🧠 Semantic search (meaning + keyword)")
+        # Tìm trong một section (vd. contraindications) khi đã index với --fields
+        fields_path = os.path.splitext(index_path)[0] + ".fields.jsonl"
+        section = None
+        if os.path.exists(fields_path) and not semantic_on:
+            from pdf_index_fields import FIELDS
+            section = st.selectbox("📑 Section", ("(whole pages)",) + FIELDS)
+            section = None if section == "(whole pages)" else section
+        if keyword:
+            # Đo từng pha (nạp, tìm, kiểm tra file, hiển thị); truy vấn chậm được ghi vào slow-query log
+            timer = PhaseTimer()
+            mode = query_mode(section, semantic_on)
+            try:
+                with timer.phase("load"):
+                    if section:
+                        data = cached_fields(fields_path, os.path.getmtime(fields_path))
+                    elif semantic_on:
+                        data = cached_semantic(index_path, os.path.getmtime(embeddings))
+                    else:
+                        if snapshot is None:
+                            snapshot = (latest, cached_index(index_path, latest))
+                            st.session_state['index_snapshot'] = snapshot
+                        data = snapshot[1]
+                with timer.phase("search"):
+                    hits = search_loaded(data, mode, keyword, section)
+            except (IndexFormatError, RuntimeError) as e:
+                st.error(f"Cannot search index: {e}")
+                return
+
+            # Lọc các file (PDF/ảnh) còn tồn tại thật sự trên ổ cứng
+            with timer.phase("check_files"):
+                results = [{"filename": rel_path, "page": page_no, "text": text}
+                           for rel_path, page_no, text in existing_hits(folder, hits)]
+
+            found = ("passage(s) related to" if semantic_on else
+                     f"`{section}` section(s) containing" if section else "page(s) containing keyword")
+            with timer.phase("render"):
+                show_results(results, keyword, folder, found)
+            logged = log_query(slow_query_logger(slow_log_path(index_path)), keyword, mode, section,
+                               len(results), timer)
+            if debug:
+                show_timings(timer, logged)
+
+    # --- FOOTER ---
+    st.markdown("""<br><hr><div style='text-align:center; font-size: 12px'>
+    | Copyright 2025 | 🧠 Nghiên Cứu Thuốc | PharmApp |<br>
+    | Discover | Design | Optimize | Create | Deliver | <br>
+    | www.nghiencuuthuoc.com | Zalo: +84888999311 | www.pharmapp.vn |
+    </div>""", unsafe_allow_html=True)
+
+if __name__ == "__main__":
+    run()
@@ -1,176 +1,774 @@
-import os, json, tempfile
-from datetime import datetime
-import pdfplumber
-from tqdm import tqdm
-import argparse
-
-# --- Argument Parser ---
-parser = argparse.ArgumentParser(description="Index PDF files and extract page-level text.")
-parser.add_argument(
-    '--path',
-    type=str,
-    default="../database/pdf-test",
-    help='Path to the folder containing PDFs (default: ../database/pdf-test)'
-)
-args = parser.parse_args()
-
-# --- Dynamic Paths ---
-OCR_FOLDER = os.path.abspath(args.path)
-INDEX_JSON = os.path.join(OCR_FOLDER, "index.json")
-ERROR_LOG = os.path.join(OCR_FOLDER, "index_failed.txt")
-DETAIL_LOG = os.path.join(OCR_FOLDER, "index.log.txt")
-
-# --- Utility functions ---
-def get_all_pdfs(folder):
-    pdf_files = []
-    for root, _, files in os.walk(folder):
-        for f in files:
-            if f.lower().endswith(".pdf"):
-                full_path = os.path.join(root, f)
-                rel_path = os.path.relpath(full_path, OCR_FOLDER)
-                pdf_files.append(rel_path)
-    return pdf_files
-
-def log_error(file_path, error_message):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open(ERROR_LOG, "a", encoding="utf-8") as f:
-        f.write(f"[{timestamp}] ❌ {file_path}: {error_message}\n")
-
-def log_info(message):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open(DETAIL_LOG, "a", encoding="utf-8") as f:
-        f.write(f"[{timestamp}] {message}\n")
-
-def index_single_pdf(rel_path):
-    abs_path = os.path.join(OCR_FOLDER, rel_path)
-    page_data = []
-    try:
-        with pdfplumber.open(abs_path) as pdf:
-            for i, page in enumerate(tqdm(pdf.pages, desc=f"📄 {rel_path}", leave=False), start=1):
-                text = page.extract_text()
-                if text:
-                    page_data.append({"page": i, "text": text.strip()})
-        return page_data
-    except Exception as e:
-        log_error(rel_path, str(e))
-        return None
-
-# --- Safe JSON helpers ---
-def _backup_corrupt_index(src_path):
-    try:
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        dst = f"{src_path}.bad_{ts}.json"
-        os.replace(src_path, dst)  # atomic rename
-        return dst
-    except Exception:
-        return None
-
-def _write_json_atomic(path, data):
-    dir_ = os.path.dirname(path)
-    fd, tmp_path = tempfile.mkstemp(prefix="index_", suffix=".tmp", dir=dir_)
-    try:
-        with os.fdopen(fd, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-            f.flush()
-            os.fsync(f.fileno())
-        os.replace(tmp_path, path)  # atomic on Windows & POSIX
-    finally:
-        if os.path.exists(tmp_path):
-            try:
-                os.remove(tmp_path)
-            except Exception:
-                pass
-
-def load_existing_index():
-    if os.path.exists(INDEX_JSON):
-        try:
-            with open(INDEX_JSON, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                # Đảm bảo kiểu dict
-                if not isinstance(data, dict):
-                    raise json.JSONDecodeError("index.json must be an object", doc="", pos=0)
-                return data
-        except json.JSONDecodeError as e:
-            bak = _backup_corrupt_index(INDEX_JSON)
-            log_info(f"⚠️ index.json corrupt, backed up to {bak or '(backup failed)'}: {e}")
-            return {}
-    return {}
-
-# --- NEW: prune stale entries that no longer exist on disk ---
-def prune_stale_entries(index_data, current_rel_paths):
-    if not isinstance(index_data, dict):
-        return 0
-    keep = set(current_rel_paths)
-    # Chỉ xét các key là đường dẫn (bỏ qua field kỹ thuật nếu có)
-    keys = [k for k in list(index_data.keys()) if isinstance(k, str) and not k.startswith("_")]
-    stale = [k for k in keys if k not in keep]
-    removed = 0
-    for k in stale:
-        del index_data[k]
-        removed += 1
-        log_info(f"🧹 Removed stale index: {k}")
-    if removed:
-        _write_json_atomic(INDEX_JSON, index_data)
-    return removed
-
-def index_all(folder):
-    # 1) Quét danh sách PDF hiện có
-    all_files = get_all_pdfs(folder)
-
-    # 2) Nạp index hiện có (tự backup nếu hỏng)
-    index_result = load_existing_index()
-
-    # 3) DỌN RÁC: xóa các entry không còn file
-    pruned = prune_stale_entries(index_result, all_files)
-
-    indexed = skipped = updated = 0
-
-    # 4) Index/Update theo mtime
-    for rel_path in tqdm(all_files, desc="🔍 Indexing PDFs"):
-        abs_path = os.path.join(folder, rel_path)
-
-        # Lấy mtime an toàn
-        try:
-            file_mtime = os.path.getmtime(abs_path)
-        except FileNotFoundError:
-            # File vừa bị xoá/di chuyển giữa lúc chạy → bỏ qua; sẽ được prune ở vòng sau
-            log_info(f"⏭️ Skipped (disappeared): {rel_path}")
-            continue
-
-        cached = index_result.get(rel_path)
-        cached_mtime = cached.get("_mtime") if isinstance(cached, dict) else None
-        if cached_mtime is not None and file_mtime <= cached_mtime:
-            skipped += 1
-            continue
-
-        log_info(f"📌 Processing {rel_path}")
-        content = index_single_pdf(rel_path)
-        if content:
-            index_result[rel_path] = {
-                "_mtime": file_mtime,
-                "pages": content
-            }
-            updated += 1
-            # Ghi nguyên tử sau mỗi file để tránh mất dữ liệu
-            _write_json_atomic(INDEX_JSON, index_result)
-        else:
-            log_error(rel_path, "No content or error during indexing.")
-        indexed += 1
-
-    return index_result, indexed, skipped, updated, pruned
-
-# --- Main ---
-if __name__ == "__main__":
-    print(f"🚀 Starting PDF indexing in: {OCR_FOLDER}")
-    os.makedirs(os.path.dirname(INDEX_JSON), exist_ok=True)
-
-    result, total_indexed, total_skipped, total_updated, total_pruned = index_all(OCR_FOLDER)
-
-    print(f"✅ Done. Indexed: {total_indexed} | Skipped: {total_skipped} | Updated: {total_updated} | Pruned: {total_pruned}")
-    print(f"📁 Index saved → {INDEX_JSON}")
-    print(f"📝 Error log → {ERROR_LOG}")
-    print(f"📋 Detailed log → {DETAIL_LOG}")
-
-# how_use
-# python CP-2025_index_pdf.py
-# python CP-2025_index_pdf.py --path="D:/Books/MyPDFs"
+import os
+import gc
+import argparse
+import shutil
+import tempfile
+from datetime import datetime
+from pdf_index_compact import CompactError, compact_index, spool_lock_target
+from pdf_index_lock import IndexLock
+from pdf_index_log import LOG_FORMATS, IndexLogger
+from pdf_index_scheduler import POLICIES, RunBudget, Task, fair_merge, order_tasks, within_dirs
+from pdf_index_store import (IndexFormatError, IndexVersionError, PageSpool, file_stamp, listing_digest,
+                             load_index_dict, load_index_meta, read_header, refresh_header, save_index)
+
+# pdfplumber và tqdm nặng → chỉ import khi thật sự có file cần index (xem index_all / index_single_pdf)
+
+# --- Argument Parser ---
+def build_parser():
+    parser = argparse.ArgumentParser(description="Index PDF files and extract page-level text.")
+    parser.add_argument(
+        'command',
+        nargs='?',
+        choices=("index", "compact"),
+        default="index",
+        help='index (default): index new/changed PDFs; compact: rewrite index.json in path order and clean up'
+    )
+    parser.add_argument(
+        '--path',
+        type=str,
+        nargs='+',
+        default=["../database/pdf-test"],
+        help='Folder(s) containing PDFs, each with its own index.json (default: ../database/pdf-test)'
+    )
+    parser.add_argument(
+        '--policy',
+        choices=POLICIES,
+        default="walk",
+        help='Order of files to index: walk (folder order, default), newest (mtime) or smallest first'
+    )
+    parser.add_argument(
+        '--priority-dir',
+        action='append',
+        default=[],
+        help='Index PDFs under this folder (relative to --path, repeatable) before anything else'
+    )
+    parser.add_argument(
+        '--subtree',
+        action='append',
+        default=[],
+        help='Only scan/index/prune PDFs under this folder (relative to --path, repeatable); runs on other subtrees of the same root can go in parallel'
+    )
+    parser.add_argument(
+        '--retry-failed',
+        action='store_true',
+        help='Parse again PDFs that failed in an earlier run (they are otherwise skipped until they change)'
+    )
+    parser.add_argument(
+        '--max-minutes',
+        type=float,
+        default=0,
+        help='Stop starting new files after this many minutes; the rest waits for the next run (default: 0 = no limit)'
+    )
+    parser.add_argument(
+        '--max-pages',
+        type=int,
+        default=0,
+        help='Stop starting new files after this many pages (default: 0 = no limit)'
+    )
+    parser.add_argument(
+        '--term-matrix',
+        action='store_true',
+        help='Build index.terms.npz (page-term matrix, needs numpy); kept up to date once it exists'
+    )
+    parser.add_argument(
+        '--word-cache',
+        action='store_true',
+        help='Keep index.words/ (words + bounding boxes per page) to replay text cleanup without re-parsing; kept up to date once it exists'
+    )
+    parser.add_argument(
+        '--fields',
+        action='store_true',
+        help='Split leaflets into named sections and extract tables into index.fields.jsonl (section-scoped search); kept up to date once it exists'
+    )
+    parser.add_argument(
+        '--semantic',
+        action='store_true',
+        help='After indexing, embed new/changed page chunks for semantic search (needs sentence-transformers)'
+    )
+    parser.add_argument(
+        '--prefetch',
+        type=int,
+        default=0,
+        help='Read upcoming PDFs ahead with N threads (useful on SMB/NFS shares; default: 0 = off)'
+    )
+    parser.add_argument(
+        '--prefetch-mb',
+        type=float,
+        default=256,
+        help='Max MB of prefetched PDFs held in memory (default: 256)'
+    )
+    parser.add_argument(
+        '--prefetch-bw-mb',
+        type=float,
+        default=0,
+        help='Max prefetch read bandwidth in MB/s (default: 0 = unlimited)'
+    )
+    parser.add_argument(
+        '--cache-dir',
+        type=str,
+        default=None,
+        help='Local (SSD) folder caching PDF copies, reused while size+mtime match; implies --prefetch'
+    )
+    parser.add_argument(
+        '--cache-max-mb',
+        type=float,
+        default=10240,
+        help='Max MB of PDF copies kept in --cache-dir; least recently used copies are deleted first (default: 10240, 0 = unlimited)'
+    )
+    parser.add_argument(
+        '--max-memory-mb',
+        type=float,
+        default=0,
+        help='Low-memory mode: keep only document metadata in RAM (page text stays in index.json) and aim to stay under this many MB (default: 0 = off)'
+    )
+    parser.add_argument(
+        '--keep-backups',
+        type=int,
+        default=1,
+        help='compact: number of newest index.json.bad_*.json backups to keep (default: 1)'
+    )
+    parser.add_argument(
+        '--log-format',
+        choices=LOG_FORMATS,
+        default="text",
+        help='Format of index.log.txt / index_failed.txt (default: text)'
+    )
+    parser.add_argument(
+        '--log-max-mb',
+        type=float,
+        default=5,
+        help='Rotate a log file once it grows past this size in MB (default: 5, 0 = never)'
+    )
+    return parser
+
+# --- Dynamic Paths (set by configure) ---
+OCR_FOLDER = INDEX_JSON = ERROR_LOG = DETAIL_LOG = TERMS_NPZ = WORDS_DIR = FIELDS_JSONL = None
+ERROR_LOGGER = DETAIL_LOGGER = None
+_ROOTS = {}  # OCR_FOLDER → (INDEX_JSON, TERMS_NPZ, WORDS_DIR, FIELDS_JSONL, ERROR_LOG, DETAIL_LOG, ERROR_LOGGER, DETAIL_LOGGER)
+_SEEN = {}   # INDEX_JSON → {"stamp": file_stamp của index.json lần cuối lần chạy này đọc/ghi, "merged": có gộp từ writer khác}
+
+def configure(folder, log_format="text", log_max_mb=5):
+    """Point the paths and loggers above at ``folder``; loggers are created once per folder.
+
+    Calling it again for a folder that was already configured just switches back to it.
+    """
+    global OCR_FOLDER, INDEX_JSON, ERROR_LOG, DETAIL_LOG, TERMS_NPZ, WORDS_DIR, FIELDS_JSONL, ERROR_LOGGER, DETAIL_LOGGER
+    OCR_FOLDER = os.path.abspath(folder)
+    if OCR_FOLDER not in _ROOTS:
+        index_json = os.path.join(OCR_FOLDER, "index.json")
+        terms_npz = os.path.join(OCR_FOLDER, "index.terms.npz")
+        words_dir = os.path.join(OCR_FOLDER, "index.words")
+        fields_jsonl = os.path.join(OCR_FOLDER, "index.fields.jsonl")
+        error_log = os.path.join(OCR_FOLDER, "index_failed.txt")
+        detail_log = os.path.join(OCR_FOLDER, "index.log.txt")
+
+        # --- Loggers (ghi nền, theo lô) ---
+        log_max_bytes = int(log_max_mb * 1024 * 1024)
+        _ROOTS[OCR_FOLDER] = (index_json, terms_npz, words_dir, fields_jsonl, error_log, detail_log,
+                              IndexLogger(error_log, fmt=log_format, max_bytes=log_max_bytes),
+                              IndexLogger(detail_log, fmt=log_format, max_bytes=log_max_bytes))
+    (INDEX_JSON, TERMS_NPZ, WORDS_DIR, FIELDS_JSONL,
+     ERROR_LOG, DETAIL_LOG, ERROR_LOGGER, DETAIL_LOGGER) = _ROOTS[OCR_FOLDER]
+
+def close_logs():
+    for *_, error_logger, detail_logger in _ROOTS.values():
+        detail_logger.close()
+        error_logger.close()
+
+# --- Utility functions ---
+def get_all_pdfs(folder, subdirs=()):
+    pdf_files = []
+    # subdirs (--subtree): chỉ quét các thư mục con này của folder
+    for top in [os.path.join(folder, d) for d in subdirs] or [folder]:
+        for root, _, files in os.walk(top):
+            for f in files:
+                if f.lower().endswith(".pdf"):
+                    full_path = os.path.join(root, f)
+                    rel_path = os.path.relpath(full_path, folder)
+                    pdf_files.append(rel_path)
+    return pdf_files
+
+def log_error(file_path, error_message):
+    ERROR_LOGGER.log(f"❌ {file_path}: {error_message}", level="ERROR", file=file_path, error=error_message)
+
+def log_info(message):
+    DETAIL_LOGGER.log(message)
+
+# --- Page fingerprints ---
+# Hash của content stream + resources (font, ảnh...) của từng trang, tính trên dữ liệu thô
+# (không phân tích layout) → biết trang nào không đổi để dùng lại text cũ.
+def _pdf_obj_digest(obj, memo, depth=0):
+    import hashlib
+    from pdfminer.pdftypes import PDFObjRef, PDFStream
+    if isinstance(obj, PDFObjRef):
+        key = obj.objid
+        if key not in memo:
+            memo[key] = b"cycle"  # chặn tham chiếu vòng
+            memo[key] = _pdf_obj_digest(obj.resolve(), memo, depth + 1)
+        return memo[key]
+    h = hashlib.sha1()
+    if depth > 12:
+        h.update(b"deep")
+    elif isinstance(obj, PDFStream):
+        h.update(b"S" + _pdf_obj_digest(obj.attrs, memo, depth + 1))
+        h.update(obj.rawdata if obj.rawdata is not None else obj.get_data())
+    elif isinstance(obj, dict):
+        for k in sorted(obj, key=str):
+            h.update(b"K" + str(k).encode("utf-8") + _pdf_obj_digest(obj[k], memo, depth + 1))
+    elif isinstance(obj, (list, tuple)):
+        for v in obj:
+            h.update(b"L" + _pdf_obj_digest(v, memo, depth + 1))
+    else:
+        h.update(repr(obj).encode("utf-8"))
+    return h.digest()
+
+def page_fingerprint(page, memo):
+    """Stable short hash of a pdfplumber page's content streams and resources."""
+    import hashlib
+    page_obj = page.page_obj
+    h = hashlib.sha1()
+    h.update(_pdf_obj_digest(page_obj.contents, memo))
+    h.update(_pdf_obj_digest(page_obj.resources, memo))
+    h.update(repr(page_obj.mediabox).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+def _reusable_texts(record):
+    """Map page fingerprint → text from an existing index record (empty pages map to "")."""
+    if not isinstance(record, dict) or not record.get("page_fps"):
+        return {}
+    texts = {p.get("page"): p.get("text") or "" for p in record.get("pages") or []}
+    return {fp: texts.get(i, "") for i, fp in enumerate(record["page_fps"], start=1)}
+
+def iter_pdf_pages(source, desc=None, reuse=None, words=None, tables=None):
+    """Yield (page_no, text, fingerprint, reused, page_words, page_tables) one page at a time.
+
+    ``source`` is a path or file object. Pages whose fingerprint is in ``reuse`` (fingerprint → text)
+    are not re-extracted. With ``words`` (fingerprint → cached PageWords, may be empty) every page
+    also comes with its PageWords, and with ``tables`` (fingerprint → known tables, may be empty)
+    with its tables (pdfplumber ``extract_tables``); a page is only reused if those are known too.
+    Otherwise ``page_words`` / ``page_tables`` are None. Each page's parsed objects are released right after use.
+    """
+    import pdfplumber
+    from tqdm import tqdm
+    reuse = reuse or {}
+    if words is not None:
+        from pdf_index_words import PageWords
+        reuse = {fp: text for fp, text in reuse.items() if fp in words}
+    if tables is not None:
+        reuse = {fp: text for fp, text in reuse.items() if fp in tables}
+    with pdfplumber.open(source) as pdf:
+        # Tính fingerprint cho mọi trang trước khi trích xuất: lúc này stream vẫn ở dạng thô,
+        # nên hash ổn định giữa các lần chạy (font dùng chung chỉ hash một lần nhờ memo)
+        memo = {}
+        fps = [page_fingerprint(page, memo) for page in pdf.pages]
+        memo.clear()
+        for i, page in enumerate(tqdm(pdf.pages, desc=desc, leave=False), start=1):
+            fp = fps[i - 1]
+            if fp in reuse:
+                cached = words[fp] if words is not None else None
+                if cached is not None:
+                    cached.page_no = i  # trang có thể đã đổi vị trí
+                yield i, reuse[fp], fp, True, cached, tables[fp] if tables is not None else None
+                continue
+            try:
+                text = page.extract_text()
+                # Dùng chung page.chars đã parse cho extract_text → chi phí thêm nhỏ
+                page_words = PageWords.from_page(page, i, fp) if words is not None else None
+                page_tables = page.extract_tables() if tables is not None else None
+            finally:
+                page.close()  # flush cache của page (chars, layout...) → RAM không tăng theo số trang
+            yield i, text, fp, False, page_words, page_tables
+
+def index_single_pdf(rel_path, spool_dir, previous=None, source=None, word_cache=False, tables=None):
+    """Extract ``rel_path`` into a PageSpool; returns (spool, page_fps, page_tables) or (None, None, None) on error.
+
+    Pages unchanged since ``previous`` (the document's existing record) reuse its text.
+    ``source`` is an already-read copy of the file (BytesIO/mmap from the prefetcher), if any.
+    With ``word_cache`` the document's words and bounding boxes are written to index.words/ too.
+    With ``tables`` (fingerprint → tables known from the previous run) the document's tables are
+    returned as [(page_no, fingerprint, rows)]; otherwise ``page_tables`` is None.
+    """
+    abs_path = os.path.join(OCR_FOLDER, rel_path)
+    fd, spool_path = tempfile.mkstemp(suffix=".jsonl", dir=spool_dir)
+    os.close(fd)
+    spool = PageSpool(spool_path)
+    words = writer = None
+    if word_cache:
+        from pdf_index_words import WordCacheWriter, load_document, words_path
+        words = load_document(INDEX_JSON, rel_path)
+        writer = WordCacheWriter(words_path(INDEX_JSON, rel_path), rel_path)
+    page_fps = []
+    page_tables = [] if tables is not None else None
+    reused = 0
+    try:
+        # Trang được ghi ra spool ngay khi trích xuất, không giữ cả tài liệu trong RAM
+        for i, text, fp, was_reused, page_words, found in iter_pdf_pages(
+                source or abs_path, desc=f"📄 {rel_path}", reuse=_reusable_texts(previous),
+                words=words, tables=tables):
+            page_fps.append(fp)
+            reused += was_reused
+            if text:
+                spool.append({"page": i, "text": text.strip()})
+            if writer is not None:
+                writer.add(page_words)
+            if page_tables is not None:
+                page_tables.extend((i, fp, [[cell or "" for cell in row] for row in table]) for table in found)
+        spool.close()
+        if writer is not None:
+            writer.close()
+        if reused:
+            log_info(f"♻️ Reused {reused}/{len(page_fps)} unchanged page(s): {rel_path}")
+        return spool, page_fps, page_tables
+    except Exception as e:
+        spool.discard()
+        if writer is not None:
+            writer.discard()
+        log_error(rel_path, str(e))
+        return None, None, None
+
+# --- Safe JSON helpers ---
+def _backup_corrupt_index(src_path):
+    try:
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        dst = f"{src_path}.bad_{ts}.json"
+        os.replace(src_path, dst)  # atomic rename
+        return dst
+    except Exception:
+        return None
+
+def load_existing_index(low_memory=False):
+    _SEEN[INDEX_JSON] = {"stamp": None, "merged": False}
+    if os.path.exists(INDEX_JSON):
+        try:
+            _SEEN[INDEX_JSON]["stamp"] = file_stamp(INDEX_JSON)
+            # Đọc được cả index cũ (v1, không có "_schema") lẫn v2.
+            # low_memory: chỉ giữ metadata, trang được đọc lại từ index.json khi cần
+            return load_index_meta(INDEX_JSON) if low_memory else load_index_dict(INDEX_JSON)
+        except IndexVersionError:
+            raise  # index của phiên bản mới hơn: không được coi là hỏng
+        except IndexFormatError as e:
+            bak = _backup_corrupt_index(INDEX_JSON)
+            log_info(f"⚠️ index.json corrupt, backed up to {bak or '(backup failed)'}: {e}")
+            _SEEN[INDEX_JSON]["stamp"] = None
+            return {}
+    return {}
+
+# --- Concurrent writers ---
+# Hai người chạy indexer trên cùng share, hoặc các lần chạy --subtree song song trên một root:
+# trước mỗi lần ghi (trong index.lock) gộp các tài liệu mà writer khác đã ghi vào index.json,
+# thay vì ghi đè bằng bản trong RAM (last-writer-wins làm mất kết quả của lần chạy kia).
+def _merge_concurrent(index_data, changed=(), removed=()):
+    """Adopt what other writers saved to index.json since this run last read or wrote it.
+
+    Records in ``changed`` keep this run's version and keys in ``removed`` stay removed.
+    """
+    seen = _SEEN.setdefault(INDEX_JSON, {"stamp": None, "merged": False})
+    try:
+        stamp = file_stamp(INDEX_JSON)
+    except OSError:
+        return  # chưa có index.json
+    if stamp == seen["stamp"]:
+        return
+    try:
+        disk = load_index_meta(INDEX_JSON)
+    except IndexFormatError as e:
+        log_info(f"⚠️ Cannot merge index.json written by another run, overwriting it: {e}")
+        return
+    mine = {k: index_data[k] for k in changed if k in index_data}
+    index_data.clear()
+    index_data.update(disk)
+    index_data.update(mine)
+    for k in removed:
+        index_data.pop(k, None)
+    seen.update(stamp=stamp, merged=True)
+    log_info(f"🔀 Merged index.json saved by another run ({len(disk)} documents)")
+
+def commit_index(index_data, changed=(), removed=()):
+    """Save ``index_data`` to INDEX_JSON under index.lock, merging concurrent writers first."""
+    with IndexLock(INDEX_JSON) as lock:
+        _merge_concurrent(index_data, changed, removed)
+        save_index(INDEX_JSON, index_data, check=lambda _: lock.verify())
+        _SEEN[INDEX_JSON]["stamp"] = file_stamp(INDEX_JSON)
+
+# --- NEW: prune stale entries that no longer exist on disk ---
+def prune_stale_entries(index_data, current_rel_paths, subdirs=()):
+    if not isinstance(index_data, dict):
+        return 0
+    keep = set(current_rel_paths)
+    # Chỉ xét các key là đường dẫn (bỏ qua field kỹ thuật nếu có)
+    keys = [k for k in list(index_data.keys()) if isinstance(k, str) and not k.startswith("_")]
+    if subdirs:
+        keys = within_dirs(keys, OCR_FOLDER, subdirs)  # file ngoài --subtree thuộc lần chạy khác
+    stale = [k for k in keys if k not in keep]
+    removed = 0
+    for k in stale:
+        del index_data[k]
+        removed += 1
+        log_info(f"🧹 Removed stale index: {k}")
+    if removed:
+        commit_index(index_data, removed=stale)
+    return removed
+
+def _stat_mtimes(folder, rel_paths):
+    mtimes = {}
+    for rel_path in rel_paths:
+        try:
+            mtimes[rel_path] = os.path.getmtime(os.path.join(folder, rel_path))
+        except FileNotFoundError:
+            pass
+    return mtimes
+
+def index_all(folder, term_matrix=False, prefetch=None, schedule=None, word_cache=False, fields=False,
+              memory_limit=None):
+    root = os.path.abspath(folder)
+    return index_roots([root], term_matrix=term_matrix, prefetch=prefetch, schedule=schedule,
+                       word_cache=word_cache, fields=fields, memory_limit=memory_limit)[root][:5]
+
+def index_roots(folders, term_matrix=False, prefetch=None, schedule=None, word_cache=False, fields=False,
+                memory_limit=None):
+    """Index several root folders in one run; each keeps its own index.json, logs and term matrix.
+
+    Files of all roots go through one scheduler (see pdf_index_scheduler), one run budget and one
+    prefetch pool. ``schedule`` may hold ``policy``, ``priority_dirs``, ``subtrees``, ``max_seconds``
+    and ``max_pages``.
+    With ``memory_limit`` (bytes) only document metadata is kept in memory (low-memory mode).
+    Returns {root: (index_result, indexed, skipped, updated, pruned, deferred)}.
+    """
+    schedule = schedule or {}
+    jobs = {}
+    try:
+        # 1–4a) Mỗi thư mục gốc: quét, prune, chọn file cần index
+        for folder in folders:
+            configure(folder)
+            if OCR_FOLDER not in jobs:
+                jobs[OCR_FOLDER] = _start_root(term_matrix, word_cache, fields, low_memory=bool(memory_limit),
+                                               subtrees=schedule.get("subtrees") or (),
+                                               retry_failed=schedule.get("retry_failed", False))
+
+        # 4b) Xếp lịch: chính sách + thư mục ưu tiên trong từng root, rồi chia lượt công bằng giữa các root
+        tasks = fair_merge([order_tasks(job["todo"], root, schedule.get("policy", "walk"),
+                                        schedule.get("priority_dirs") or ())
+                            for root, job in jobs.items()])
+        budget = RunBudget(schedule.get("max_seconds"), schedule.get("max_pages"))
+        done = _run_tasks(jobs, tasks, budget, prefetch, memory_limit)
+        for task in tasks[done:]:
+            jobs[task.job]["deferred"] += 1
+
+        for root, job in jobs.items():
+            configure(root)
+            if job["deferred"]:
+                log_info(f"⏸️ Run budget reached, {job['deferred']} file(s) left for the next run")
+            _finish_root(job)
+    finally:
+        # Sau bước này các PageSpool trong index_result không còn đọc được; index.json đã có đủ dữ liệu
+        for job in jobs.values():
+            if job["spool_dir"]:
+                job["spool_lock"].release()
+                shutil.rmtree(job["spool_dir"], ignore_errors=True)
+
+    return {root: (job["index_result"], job["indexed"], job["skipped"], job["updated"], job["pruned"],
+                   job["deferred"]) for root, job in jobs.items()}
+
+def _words_missing(header):
+    """True if index.words/ holds fewer documents than the index (some still need their word cache)."""
+    try:
+        return len(os.listdir(WORDS_DIR)) < header.get("documents", 0) - header.get("failed", 0)
+    except OSError:
+        return True
+
+def _fields_stale(header):
+    from pdf_index_fields import read_digest
+    return read_digest(FIELDS_JSONL) != header.get("digest")
+
+def _start_root(term_matrix=False, word_cache=False, fields=False, low_memory=False, subtrees=(),
+                retry_failed=False):
+    """Scan the configured root (or its ``subtrees``), prune it and return its job (files to index as scheduler Tasks)."""
+    job = {"index_result": None, "terms": None, "fields": None, "spool_dir": None, "spool_lock": None, "todo": [],
+           "word_cache": False, "changed": set(), "indexed": 0, "skipped": 0, "updated": 0, "pruned": 0, "deferred": 0}
+
+    # 1) Quét danh sách PDF hiện có
+    all_files = get_all_pdfs(OCR_FOLDER, subtrees)
+    build_terms = term_matrix or os.path.exists(TERMS_NPZ)
+    build_words = job["word_cache"] = word_cache or os.path.isdir(WORDS_DIR)
+    build_fields = fields or os.path.exists(FIELDS_JSONL)
+
+    # 1b) Đường tắt: header khớp với (path, mtime) trên đĩa → không cần đọc index.json
+    header = read_header(INDEX_JSON)
+    if header and not (build_terms and not os.path.exists(TERMS_NPZ)) and not (build_words and _words_missing(header)) \
+            and not (retry_failed and header.get("failed")) \
+            and not (build_fields and _fields_stale(header)) \
+            and header.get("digest") == listing_digest(_stat_mtimes(OCR_FOLDER, all_files).items()):
+        log_info(f"✅ Nothing changed ({header.get('documents')} documents, version {header.get('version')})")
+        job["skipped"] = len(all_files)
+        return job
+
+    # 2) Nạp index hiện có (tự backup nếu hỏng)
+    index_result = job["index_result"] = load_existing_index(low_memory)
+
+    # 2b) Ma trận trang-từ (index.terms.npz): nạp trước khi prune để không phải dựng lại toàn bộ
+    if build_terms:
+        from pdf_index_terms import open_term_matrix
+        job["terms"] = open_term_matrix(TERMS_NPZ, index_result)
+
+    # 3) DỌN RÁC: xóa các entry không còn file
+    job["pruned"] = prune_stale_entries(index_result, all_files, subtrees)
+    if job["terms"] is not None:
+        job["terms"].retain(index_result)
+    if build_words:
+        from pdf_index_words import prune as prune_words, words_path
+        if not subtrees:  # cache được đặt tên theo hash → không biết file nào thuộc subtree; để compact dọn
+            prune_words(INDEX_JSON, [k for k in index_result if not k.startswith("_")])
+    if build_fields:
+        from pdf_index_fields import open_field_index
+        job["fields"] = open_field_index(FIELDS_JSONL)
+        job["fields"].retain(index_result)
+
+    # 4a) Chọn các file cần index (mtime mới hơn bản trong index)
+    for rel_path in all_files:
+        abs_path = os.path.join(OCR_FOLDER, rel_path)
+
+        # Lấy mtime an toàn
+        try:
+            st = os.stat(abs_path)
+        except FileNotFoundError:
+            # File vừa bị xoá/di chuyển giữa lúc chạy → bỏ qua; sẽ được prune ở vòng sau
+            log_info(f"⏭️ Skipped (disappeared): {rel_path}")
+            continue
+
+        cached = index_result.get(rel_path)
+        cached_mtime = cached.get("_mtime") if isinstance(cached, dict) else None
+        if isinstance(cached, dict) and cached.get("_error"):
+            up_to_date = not retry_failed  # lỗi ở lần trước: chỉ thử lại khi file đổi hoặc với --retry-failed
+        else:
+            # Bật --word-cache / --fields lần đầu: tài liệu chưa có cache/bảng phải parse lại một lần
+            up_to_date = not (build_words and not os.path.exists(words_path(INDEX_JSON, rel_path))) \
+                and not (build_fields and rel_path not in job["fields"].docs)
+        if cached_mtime is not None and st.st_mtime <= cached_mtime and up_to_date:
+            job["skipped"] += 1
+            continue
+        job["todo"].append(Task(OCR_FOLDER, rel_path, abs_path, st.st_mtime, st.st_size))
+
+    # Trang của các file vừa index nằm trong spool trên đĩa cho tới hết lần chạy
+    job["spool_dir"] = tempfile.mkdtemp(prefix=".index_spool_", dir=OCR_FOLDER)
+    # Lease trong spool, gia hạn suốt lần chạy → compact chạy song song không xoá spool đang dùng
+    job["spool_lock"] = IndexLock(spool_lock_target(job["spool_dir"])).acquire()
+    return job
+
+def _finish_root(job):
+    if job["index_result"] is None:
+        return  # đi đường tắt, không có gì để ghi
+    index_result = job["index_result"]
+    with IndexLock(INDEX_JSON):
+        _merge_concurrent(index_result)
+        merged = _SEEN[INDEX_JSON]["merged"]
+        if job["terms"] is not None:
+            if merged:
+                # Tài liệu do writer khác thêm/đổi → cập nhật từng tài liệu, không dựng lại cả ma trận
+                terms = job["terms"]
+                for rel_path, record in index_result.items():
+                    if not rel_path.startswith("_") and terms.doc_mtimes.get(rel_path, False) != record.get("_mtime"):
+                        terms.update_document(rel_path, record.get("_mtime"), record.get("pages") or [])
+                terms.retain(index_result)
+            job["terms"].save(TERMS_NPZ)
+        if job["fields"] is not None:
+            if merged and os.path.exists(FIELDS_JSONL):
+                # Bản trên đĩa có section/bảng của writer khác; thêm các tài liệu lần chạy này đã index
+                from pdf_index_fields import open_field_index
+                on_disk = open_field_index(FIELDS_JSONL)
+                on_disk.adopt(job["fields"], job["changed"])
+                on_disk.retain(index_result)
+                job["fields"] = on_disk
+            job["fields"].save(FIELDS_JSONL)
+
+        # Header thiếu/cũ (vd. index tạo bởi phiên bản trước) → ghi lại để lần sau đi đường tắt.
+        # File bị hoãn vì hết ngân sách không có trong index → digest lệch → lần sau vẫn quét lại.
+        if os.path.exists(INDEX_JSON) and read_header(INDEX_JSON) is None:
+            refresh_header(INDEX_JSON, index_result)
+
+def _rss_bytes():
+    """Resident memory of this process in bytes (psutil, else /proc; None if unknown)."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def _relieve_memory(jobs, memory_limit):
+    """Free what can be freed once RSS passes ``memory_limit``; returns False if still above it."""
+    rss = _rss_bytes()
+    if rss is None or rss <= memory_limit:
+        return True
+    for job in jobs.values():
+        if job["terms"] is not None:
+            job["terms"].merge_pending()
+    gc.collect()
+    rss = _rss_bytes()
+    return rss is None or rss <= memory_limit
+
+def _run_tasks(jobs, tasks, budget, prefetch=None, memory_limit=None):
+    """Index scheduled ``tasks`` in order until ``budget`` runs out; returns how many were processed."""
+    if not tasks:
+        return 0
+    from tqdm import tqdm
+
+    # Với --prefetch, bytes của các file kế tiếp (thuộc mọi root) được đọc trước ở nền bởi một pool chung
+    prefetcher = None
+    if prefetch:
+        from pdf_index_prefetch import Prefetcher
+        prefetcher = Prefetcher("", [task.abs_path for task in tasks], **prefetch)
+        sources = iter(prefetcher)
+    else:
+        sources = ((task.abs_path, None) for task in tasks)
+
+    done = 0
+    shrunk = False
+    try:
+        for task, (_, source) in tqdm(zip(tasks, sources), total=len(tasks), desc="🔍 Indexing PDFs"):
+            if budget.exhausted():
+                break
+            configure(task.job)
+            budget.charge(_index_task(jobs[task.job], task, source))
+            done += 1
+            if memory_limit and not _relieve_memory(jobs, memory_limit):
+                # Vượt trần: bỏ bộ đệm đọc trước trước, nếu vẫn vượt thì không bắt đầu file mới nữa
+                rss_mb = _rss_bytes() // 2**20
+                if prefetcher is not None and not shrunk:
+                    shrunk = True
+                    prefetcher.set_max_bytes(0)
+                    log_info(f"⚠️ Memory above --max-memory-mb ({rss_mb} MB) after {task.rel_path}: prefetch reduced to one file")
+                else:
+                    log_info(f"⏸️ Memory above --max-memory-mb ({rss_mb} MB) after {task.rel_path}: "
+                             f"stopping, {len(tasks) - done} file(s) left for the next run")
+                    break
+    finally:
+        sources.close()  # dừng sớm → huỷ các file đang đọc trước
+    return done
+
+def _index_task(job, task, source=None):
+    """Extract one scheduled file into its root's index; returns the number of pages it has."""
+    rel_path = task.rel_path
+    index_result = job["index_result"]
+    _merge_concurrent(index_result)  # trang cũ dùng lại phải đọc từ index.json hiện tại
+    cached = index_result.get(rel_path)
+
+    fields = job["fields"]
+    known_tables = fields.page_tables(rel_path, (cached or {}).get("page_fps") or []) if fields is not None else None
+
+    log_info(f"📌 Processing {rel_path}")
+    content, page_fps, page_tables = index_single_pdf(rel_path, job["spool_dir"], previous=cached, source=source,
+                                                      word_cache=job["word_cache"], tables=known_tables)
+    failed = content is None
+    if failed and cached and cached.get("pages"):
+        # Lỗi (có thể tạm thời, vd. ổ mạng) với file đã có text → giữ bản cũ, mtime lệch → lần sau thử lại
+        log_error(rel_path, "Error during indexing, keeping the previous text.")
+        job["indexed"] += 1
+        return 0
+    if content:
+        job["updated"] += 1
+    else:
+        # Không có text (PDF scan/chỉ có ảnh) hoặc lỗi: vẫn ghi (path, mtime) với pages rỗng → lần sau
+        # không parse lại và digest header vẫn khớp (đường tắt "nothing changed"). Lỗi có "_error";
+        # chạy lại với --retry-failed để thử lại.
+        if content is not None:
+            content.discard()
+        log_error(rel_path, "Error during indexing." if failed else "No text extracted (scanned or image-only PDF?).")
+        content = []
+    record = index_result[rel_path] = {
+        "_mtime": task.mtime,
+        "page_fps": page_fps or [],
+        "pages": content
+    }
+    if failed:
+        record["_error"] = True
+    job["changed"].add(rel_path)
+    if job["terms"] is not None:
+        job["terms"].update_document(rel_path, task.mtime, content)
+    if fields is not None:
+        fields.update_document(rel_path, task.mtime, content, page_tables or ())
+    # Ghi nguyên tử sau mỗi file để tránh mất dữ liệu
+    commit_index(index_result, changed=(rel_path,))
+    job["indexed"] += 1
+    return len(page_fps or ())
+
+# --- Main ---
+if __name__ == "__main__":
+    parser = build_parser()
+    args = parser.parse_args()
+    roots = []
+    for path in args.path:
+        configure(path, log_format=args.log_format, log_max_mb=args.log_max_mb)
+        roots.append(OCR_FOLDER)
+
+    if args.command == "compact":
+        try:
+            for root in roots:
+                configure(root)
+                print(f"🗜️ Compacting: {INDEX_JSON}")
+                stats = compact_index(INDEX_JSON, folder=OCR_FOLDER, keep_backups=args.keep_backups, log=log_info)
+                print(f"✅ Done. Documents: {stats['documents']} | Dropped: {stats['dropped']} | "
+                      f"Leftover files removed: {stats['leftovers_removed']}")
+                print(f"💾 {stats['bytes_before']:,} → {stats['bytes_after']:,} bytes (saved {stats['bytes_saved']:,})")
+        except CompactError as e:
+            raise SystemExit(f"❌ {e}")
+        finally:
+            close_logs()
+        raise SystemExit(0)
+
+    prefetch = None
+    if args.prefetch or args.cache_dir:
+        prefetch = {
+            "workers": args.prefetch or 2,
+            "max_bytes": int(args.prefetch_mb * 1024 * 1024),
+            "bandwidth": int(args.prefetch_bw_mb * 1024 * 1024) or None,
+            "cache_dir": os.path.abspath(args.cache_dir) if args.cache_dir else None,
+            "cache_max_bytes": int(args.cache_max_mb * 1024 * 1024) or None,
+        }
+    memory_limit = int(args.max_memory_mb * 1024 * 1024) or None
+    if memory_limit and _rss_bytes() is None:
+        # Không đo được RSS (Windows/macOS chưa cài psutil) → trần bộ nhớ sẽ không có tác dụng; báo ngay
+        parser.error("--max-memory-mb needs psutil to measure memory on this system: pip install psutil")
+    if memory_limit and prefetch:
+        # Bộ nhớ đọc trước nằm trong trần bộ nhớ chung
+        prefetch["max_bytes"] = min(prefetch["max_bytes"], memory_limit // 4)
+    schedule = {
+        "policy": args.policy,
+        "priority_dirs": args.priority_dir,
+        "subtrees": args.subtree,
+        "retry_failed": args.retry_failed,
+        "max_seconds": args.max_minutes * 60 if args.max_minutes else None,
+        "max_pages": args.max_pages or None,
+    }
+
+    print(f"🚀 Starting PDF indexing in: {', '.join(roots)}")
+    for root in roots:
+        os.makedirs(root, exist_ok=True)
+
+    try:
+        results = index_roots(roots, term_matrix=args.term_matrix, prefetch=prefetch, schedule=schedule,
+                              word_cache=args.word_cache, fields=args.fields, memory_limit=memory_limit)
+        if args.semantic:
+            from pdf_index_semantic import build, embeddings_path
+            for root, (_, _, _, updated, pruned, _) in results.items():
+                configure(root)
+                if os.path.exists(INDEX_JSON) and (updated or pruned or not os.path.exists(embeddings_path(INDEX_JSON))):
+                    chunks, embedded = build(INDEX_JSON, log=log_info)
+                    print(f"🧠 Semantic index ({root}): {chunks} chunks ({embedded} newly embedded)")
+    finally:
+        close_logs()
+
+    for root, (result, total_indexed, total_skipped, total_updated, total_pruned, total_deferred) in results.items():
+        configure(root)
+        print(f"✅ Done. Indexed: {total_indexed} | Skipped: {total_skipped} | Updated: {total_updated} | Pruned: {total_pruned}"
+              + (f" | Deferred: {total_deferred}" if total_deferred else ""))
+        print(f"📁 Index saved → {INDEX_JSON}")
+        print(f"📝 Error log → {ERROR_LOG}")
+        print(f"📋 Detailed log → {DETAIL_LOG}")
+
+# how_use
+# python CP-2025_index_pdf.py
+# python CP-2025_index_pdf.py --path="D:/Books/MyPDFs"
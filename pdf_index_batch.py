@@ -0,0 +1,131 @@
+import os, re, csv, json, sys, argparse, multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pdf_index_store import iter_documents, read_terms_file
+
+# --- Batch keyword search ---
+# Tìm hàng trăm từ khoá trong một lượt duy nhất qua index: mỗi trang chỉ được quét một lần
+# bằng Aho–Corasick (pyahocorasick nếu có) hoặc một regex gộp tất cả từ khoá (cùng kết quả).
+
+CHUNK_PAGES = 2000
+
+
+class TermMatcher:
+    """Case-insensitive substring matcher for many terms at once."""
+
+    def __init__(self, terms):
+        self.terms = sorted({t.lower() for t in terms if t.strip()}, key=len, reverse=True)
+        try:
+            import ahocorasick
+        except ImportError:
+            ahocorasick = None
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for term in self.terms:
+                self._automaton.add_word(term, term)
+            self._automaton.make_automaton()
+            self._regex = None
+        else:
+            # Không có pyahocorasick: regex lookahead gộp (term dài trước) → khớp dài nhất tại mỗi vị trí;
+            # các term ngắn hơn khớp cùng vị trí đều là tiền tố của nó → đếm đủ như Aho–Corasick
+            self._automaton = None
+            self._regex = re.compile("(?=(" + "|".join(re.escape(t) for t in self.terms) + "))") if self.terms else None
+            self._prefixes = {t: [p for p in self.terms if t.startswith(p)] for t in self.terms}
+
+    def count(self, text):
+        """Return {term: occurrences} for ``text``."""
+        text = text.lower()
+        counts = {}
+        if self._automaton is not None:
+            for _, term in self._automaton.iter(text):
+                counts[term] = counts.get(term, 0) + 1
+        elif self._regex is not None:
+            for m in self._regex.finditer(text):
+                for term in self._prefixes[m.group(1)]:
+                    counts[term] = counts.get(term, 0) + 1
+        return counts
+
+
+# --- Worker process ---
+_MATCHER = None
+
+
+def _init_worker(terms):
+    global _MATCHER
+    _MATCHER = TermMatcher(terms)
+
+
+def _match_chunk(chunk):
+    rows = []
+    for rel_path, page_no, text in chunk:
+        for term, n in _MATCHER.count(text).items():
+            rows.append((term, rel_path, page_no, n))
+    return rows
+
+
+def _iter_chunks(index_path, size=CHUNK_PAGES):
+    chunk = []
+    for rel_path, record in iter_documents(index_path):
+        for page in record.get("pages") or []:
+            chunk.append((rel_path, page.get("page") or 0, page.get("text") or ""))
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def batch_search(index_path, terms, workers=None):
+    """Yield (term, rel_path, page, count) for every page of ``index_path`` containing any of ``terms``.
+
+    Pages are matched in parallel across ``workers`` processes (default: all cores); results come
+    back in index order. The reported term is the spelling from ``terms``.
+    """
+    originals = {}
+    for t in terms:
+        originals.setdefault(t.lower(), t)
+    workers = workers or multiprocessing.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(list(originals),)) as executor:
+        pending = deque()
+        for chunk in _iter_chunks(index_path):
+            pending.append(executor.submit(_match_chunk, chunk))
+            # Giới hạn số chunk đang chờ → RAM không phụ thuộc kích thước index
+            while len(pending) >= 2 * workers:
+                for term, rel_path, page_no, n in pending.popleft().result():
+                    yield originals[term], rel_path, page_no, n
+        while pending:
+            for term, rel_path, page_no, n in pending.popleft().result():
+                yield originals[term], rel_path, page_no, n
+
+
+# --- Main ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Match a list of terms against every page of a PDF index.")
+    parser.add_argument('--path', type=str, default="../database/pdf-test",
+                        help='Folder containing index.json, or the index file itself (default: ../database/pdf-test)')
+    parser.add_argument('--terms', type=str, required=True, help='Text file with one term per line (# = comment)')
+    parser.add_argument('--out', type=str, default="-", help='Output file (default: stdout)')
+    parser.add_argument('--format', choices=("csv", "jsonl"), default=None,
+                        help='Output format (default: from --out extension, csv otherwise)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.path)
+    index_json = path if os.path.isfile(path) else os.path.join(path, "index.json")
+    fmt = args.format or ("jsonl" if args.out.lower().endswith((".jsonl", ".json")) else "csv")
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8", newline="")
+    try:
+        writer = csv.writer(out) if fmt == "csv" else None
+        if writer:
+            writer.writerow(("term", "document", "page", "count"))
+        hits = 0
+        for row in batch_search(index_json, read_terms_file(args.terms), workers=args.workers):
+            if writer:
+                writer.writerow(row)
+            else:
+                out.write(json.dumps(dict(zip(("term", "document", "page", "count"), row)), ensure_ascii=False) + "\n")
+            hits += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"✅ Done. {hits} (term, page) matches", file=sys.stderr)
@@ -0,0 +1,124 @@
+import os, glob, time, shutil
+from pdf_index_lock import IndexLock, lock_path, read_lock
+from pdf_index_store import IndexFormatError, header_path, load_index_dict, manifest_path, save_index
+
+# --- Compaction ---
+# Ghi lại index theo thứ tự path, bỏ entry có PDF không còn tồn tại, dọn file tạm và backup cũ.
+# save_index thay file bằng os.replace nên app tìm kiếm vẫn đọc bản cũ tới lúc swap.
+# Giữ index.lock suốt quá trình để không nuốt mất tài liệu do indexer đang chạy ghi vào.
+
+TMP_MIN_AGE = 10 * 60  # file tạm mới hơn có thể thuộc về một lần index đang chạy
+SPOOL_LOCK = "spool"    # lock_path → <spool dir>/spool.lock, được indexer gia hạn khi còn chạy
+
+
+def spool_lock_target(spool_dir):
+    """Path to pass to IndexLock so the lease of a spool directory lives inside it."""
+    return os.path.join(spool_dir, SPOOL_LOCK)
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class CompactError(RuntimeError):
+    """Raised when an index cannot be compacted (missing or unreadable ``index.json``)."""
+
+
+def _spool_in_use(spool_dir, now):
+    """True while the indexer owning ``spool_dir`` still renews its lease (mtime of the folder does not
+    change while one large document is being extracted)."""
+    holder = read_lock(lock_path(spool_lock_target(spool_dir)))
+    return holder is not None and holder["expires"] > now
+
+
+def _leftover_files(index_path, keep_backups):
+    folder = os.path.dirname(index_path)
+    now = time.time()
+    tmp = [p for p in glob.glob(os.path.join(folder, "index_*.tmp")) if now - os.path.getmtime(p) > TMP_MIN_AGE]
+    # Spool có lease còn hạn → indexer đang chạy; spool không có lease (phiên bản cũ) → xét theo tuổi
+    tmp += [p for p in glob.glob(os.path.join(folder, ".index_spool_*"))
+            if not _spool_in_use(p, now) and now - os.path.getmtime(p) > TMP_MIN_AGE]
+    backups = sorted(glob.glob(f"{glob.escape(index_path)}.bad_*.json"))  # tên chứa timestamp → sort = thời gian
+    old_backups = backups[:-keep_backups] if keep_backups > 0 else backups
+    return tmp + old_backups
+
+
+def compact_index(index_path, folder=None, keep_backups=1, log=print):
+    """Compact ``index_path`` in place and return a stats dict.
+
+    When ``folder`` is given, entries whose PDF no longer exists under it are dropped.
+    """
+    if not os.path.exists(index_path):
+        raise CompactError(f"{index_path} not found; run the indexer on this folder first")
+    try:
+        with IndexLock(index_path) as lock:
+            return _compact(index_path, folder, keep_backups, log, lock)
+    except IndexFormatError as e:
+        raise CompactError(f"{index_path} cannot be read ({e}); restore a backup or re-run the indexer")
+
+
+def _compact(index_path, folder, keep_backups, log, lock):
+    base = os.path.splitext(index_path)[0]
+    terms_npz, embeddings_npz = base + ".terms.npz", base + ".embeddings.npz"
+    derived = [index_path, header_path(index_path), manifest_path(index_path),
+               terms_npz, embeddings_npz, base + ".embeddings.hnsw", base + ".fields.jsonl"]
+    leftovers = _leftover_files(index_path, keep_backups)
+    size_before = sum(_size(p) for p in derived + leftovers)
+
+    index_data = load_index_dict(index_path)
+    # load_index_dict đã bỏ các bản ghi không hợp lệ; bản ghi pages rỗng (PDF không có text/lỗi) được giữ
+    missing = [k for k in index_data if folder is not None and not os.path.exists(os.path.join(folder, k))]
+    for k in missing:
+        del index_data[k]
+        log(f"🧹 Dropped missing file: {k}")
+
+    compacted = {}
+    for k in sorted(index_data):
+        record = index_data[k]
+        record["pages"] = sorted(record["pages"], key=lambda p: p.get("page") or 0)
+        compacted[k] = record
+
+    save_index(index_path, compacted, check=lambda _: lock.verify())  # cũng dựng lại index.header.json và index.manifest.json
+
+    # Dựng lại các cấu trúc tìm kiếm phái sinh (bỏ vocab/tài liệu không còn dùng)
+    if os.path.exists(terms_npz):
+        from pdf_index_terms import TermMatrix
+        TermMatrix.from_index(compacted).save(terms_npz)
+        log("🔁 Rebuilt index.terms.npz")
+    if os.path.exists(embeddings_npz):
+        from pdf_index_semantic import prune
+        dropped = prune(index_path)  # bỏ vector mồ côi, dựng lại ANN; không cần model
+        log(f"🔁 Rebuilt semantic index ({dropped} orphaned vector(s) dropped)")
+    if os.path.exists(base + ".fields.jsonl"):
+        from pdf_index_fields import open_field_index
+        fields = open_field_index(base + ".fields.jsonl")
+        fields.retain(compacted)
+        fields.save(base + ".fields.jsonl")
+        log("🔁 Rewrote index.fields.jsonl")
+    if os.path.isdir(base + ".words"):
+        from pdf_index_words import prune as prune_words
+        removed = prune_words(index_path, compacted)
+        log(f"🔁 Pruned word cache ({removed} orphaned document(s) removed)")
+
+    for p in leftovers:
+        try:
+            if os.path.isdir(p):
+                shutil.rmtree(p)  # spool của một lần index bị ngắt giữa chừng
+            else:
+                os.remove(p)
+            log(f"🗑️ Removed leftover file: {os.path.basename(p)}")
+        except OSError:
+            pass
+
+    size_after = sum(_size(p) for p in derived)
+    return {
+        "documents": len(compacted),
+        "dropped": len(missing),
+        "leftovers_removed": len(leftovers),
+        "bytes_before": size_before,
+        "bytes_after": size_after,
+        "bytes_saved": size_before - size_after,
+    }
@@ -0,0 +1,197 @@
+import os, json, gzip, hashlib, argparse
+from pdf_index_lock import IndexLock
+from pdf_index_store import (SCHEMA_NAME, SCHEMA_VERSION, content_digest, load_index_dict,
+                             read_manifest, save_index, schema_header)
+
+# --- Delta packages ---
+# Máy index xuất gói chỉ gồm tài liệu thêm/đổi/xoá kể từ version N (theo index.manifest.json);
+# máy tìm kiếm áp gói vào bản sao của mình. Mỗi bản ghi có sha1, kết quả cuối được đối chiếu
+# với content digest của máy nguồn trước khi thay index.json (nguyên tử, như save_index).
+#
+# Gói là text gzip, mỗi dòng một mục:
+#   {"delta": schema, "base_version", "version", "content_digest", "documents", "changed", "removed": [...]}
+#   {"path", "created", "version", "sha1"}  rồi  <bản ghi đúng như trong index.json>   (lặp lại)
+#   {"end": số tài liệu}
+
+
+class DeltaError(ValueError):
+    """Raised when a delta package cannot be exported, read or applied."""
+
+
+def _sha1(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def iter_record_lines(index_path):
+    """Yield (rel_path, record text) straight from an index written by ``save_index`` (one document per line)."""
+    decoder = json.JSONDecoder()
+    with open(index_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n").rstrip(",")
+            if not line.startswith('"'):
+                continue  # "{" / "}"
+            key, end = decoder.raw_decode(line)
+            if not key.startswith("_"):
+                yield key, line[end + 2:]  # bỏ ": "
+
+
+def default_package_path(index_path, since, version):
+    return os.path.join(os.path.dirname(index_path), f"index.delta.{since}-{version}.jsonl.gz")
+
+
+def export_delta(index_path, since=0, out_path=None):
+    """Write the changes of ``index_path`` since version ``since`` (0 = everything) to a package.
+
+    Returns (package path, stats dict).
+    """
+    manifest = read_manifest(index_path)
+    if manifest is None:
+        raise DeltaError("index.manifest.json is missing or older than index.json; run `compact` once to rebuild it")
+    version = manifest["version"]
+    if since > version:
+        raise DeltaError(f"Version {since} is newer than the index (version {version})")
+    docs = manifest["docs"]
+    changed = {k for k, (_, v, _) in docs.items() if v > since}
+    # Gói đầy đủ thay toàn bộ index bên nhận → không cần danh sách xoá
+    removed = sorted(k for k, v in manifest["removed"].items() if v > since) if since else []
+
+    out_path = out_path or default_package_path(index_path, since, version)
+    tmp_path = out_path + ".tmp"
+    added = updated = 0
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8", newline="\n") as out:
+            head = {"delta": schema_header(), "base_version": since, "version": version,
+                    "content_digest": manifest["content_digest"], "documents": len(docs),
+                    "changed": len(changed), "removed": removed}
+            out.write(json.dumps(head, ensure_ascii=False) + "\n")
+            for rel_path, record_text in iter_record_lines(index_path):
+                if rel_path not in changed:
+                    continue
+                created, changed_at, checksum = docs[rel_path]
+                if _sha1(record_text) != checksum:
+                    raise DeltaError(f"{rel_path}: index.json does not match index.manifest.json")
+                meta = {"path": rel_path, "created": created, "version": changed_at, "sha1": checksum}
+                out.write(json.dumps(meta, ensure_ascii=False) + "\n")
+                out.write(record_text + "\n")
+                if created > since:
+                    added += 1
+                else:
+                    updated += 1
+            if added + updated != len(changed):
+                raise DeltaError("index.json is missing documents listed in index.manifest.json")
+            out.write(json.dumps({"end": added + updated}) + "\n")
+        os.replace(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return out_path, {"base_version": since, "version": version,
+                      "added": added, "updated": updated, "removed": len(removed)}
+
+
+def index_version(index_path):
+    """Version of ``index_path`` as known to delta packages (0 = no index yet, None = unknown)."""
+    if not os.path.exists(index_path):
+        return 0
+    manifest = read_manifest(index_path)
+    return manifest["version"] if manifest else None
+
+
+def apply_delta(index_path, package_path):
+    """Apply a delta package to ``index_path``; returns a stats dict (``applied`` False if already current).
+
+    The index is only replaced once every record checksum and the final content digest match.
+    """
+    try:
+        with IndexLock(index_path) as lock:
+            return _apply(index_path, package_path, lock)
+    except (EOFError, gzip.BadGzipFile) as e:
+        raise DeltaError(f"{package_path} is damaged: {e}")
+
+
+def _apply(index_path, package_path, lock):
+    with gzip.open(package_path, "rt", encoding="utf-8", newline="\n") as f:
+        try:
+            head = json.loads(f.readline())
+        except ValueError:
+            head = None
+        schema = head.get("delta") if isinstance(head, dict) else None
+        if not isinstance(schema, dict) or schema.get("name") != SCHEMA_NAME:
+            raise DeltaError(f"{package_path} is not an index delta package")
+        if schema.get("version", 0) > SCHEMA_VERSION:
+            raise DeltaError(f"{package_path} was written by a newer version (schema {schema.get('version')})")
+
+        base, version = head["base_version"], head["version"]
+        current = index_version(index_path)
+        stats = {"base_version": base, "version": version, "updated": 0, "removed": len(head["removed"])}
+        if current is not None and current >= version:
+            return dict(stats, applied=False, current=current)
+        if base > 0 and (current is None or current < base):
+            known = "unknown" if current is None else f"version {current}"
+            raise DeltaError(f"Package starts at version {base} but the index is at {known}; "
+                             f"export with --since {current or 0}")
+
+        # Gói đầy đủ (từ version 0) thay toàn bộ index; gói delta áp lên bản hiện có
+        index_data = load_index_dict(index_path) if base > 0 else {}
+        doc_versions = {}
+        while True:
+            line = f.readline()
+            if not line:
+                raise DeltaError(f"{package_path} is truncated")
+            meta = json.loads(line)
+            if "end" in meta:
+                break
+            record_text = f.readline()
+            if not record_text.endswith("\n"):
+                raise DeltaError(f"{package_path} is truncated")
+            record_text = record_text[:-1]
+            if _sha1(record_text) != meta["sha1"]:
+                raise DeltaError(f"{meta['path']}: checksum mismatch in {package_path}")
+            index_data[meta["path"]] = json.loads(record_text)
+            doc_versions[meta["path"]] = (meta["created"], meta["version"])
+        if meta["end"] != len(doc_versions):
+            raise DeltaError(f"{package_path} is truncated")
+    for rel_path in head["removed"]:
+        index_data.pop(rel_path, None)
+
+    def check(checksums):
+        if content_digest(checksums) != head["content_digest"]:
+            raise DeltaError("Result does not match the source index (content digest differs); "
+                             "apply a full package (--since 0)")
+        lock.verify()
+
+    save_index(index_path, index_data, version=version, doc_versions=doc_versions, check=check)
+    return dict(stats, applied=True, updated=len(doc_versions))
+
+
+# --- Main ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export/apply index delta packages to replicate an index.")
+    parser.add_argument('--path', type=str, default="../database/pdf-test",
+                        help='Folder containing index.json (default: ../database/pdf-test)')
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("version", help="print the index version (use it as --since on the source machine)")
+    p_export = sub.add_parser("export", help="write added/updated/removed documents since a version")
+    p_export.add_argument("--since", type=int, default=0, help="version the receiver is at (default: 0 = full)")
+    p_export.add_argument("--out", type=str, default=None, help="package file (default: index.delta.<since>-<version>.jsonl.gz)")
+    p_apply = sub.add_parser("apply", help="apply a package to this index")
+    p_apply.add_argument("package")
+    args = parser.parse_args()
+
+    index_json = os.path.join(os.path.abspath(args.path), "index.json")
+    try:
+        if args.command == "version":
+            version = index_version(index_json)
+            print("unknown (run `compact` to rebuild index.manifest.json)" if version is None else version)
+        elif args.command == "export":
+            out_path, stats = export_delta(index_json, args.since, args.out)
+            print(f"📦 {out_path}: version {stats['base_version']} → {stats['version']} | "
+                  f"Added: {stats['added']} | Updated: {stats['updated']} | Removed: {stats['removed']}")
+        else:
+            stats = apply_delta(index_json, args.package)
+            if stats["applied"]:
+                print(f"✅ Applied version {stats['base_version']} → {stats['version']} | "
+                      f"Updated: {stats['updated']} | Removed: {stats['removed']}")
+            else:
+                print(f"✅ Already at version {stats['current']} (package: {stats['version']})")
+    except DeltaError as e:
+        raise SystemExit(f"❌ {e}")
@@ -0,0 +1,265 @@
+import os, re, json, tempfile, argparse
+from pdf_index_store import iter_documents, listing_digest, schema_header
+
+# --- Fielded index (sections + tables) ---
+# Tờ HDSD (PIL) có cấu trúc cố định: "1. What X is and what it is used for", "Do not take X",
+# "6. Further information"... Bước sau trích xuất cắt text thành các section có tên và lưu các bảng
+# (pdfplumber extract_tables) vào index.fields.jsonl, kèm chỉ mục từ theo field →
+# truy vấn kiểu "contraindications có nhắc aspirin" chỉ quét một phần nhỏ thay vì cả trang.
+
+# Section chính: dòng bắt đầu bằng số thứ tự ("1." ...) theo mẫu PIL của EU
+SECTIONS = (
+    ("uses", r"what .+ is and what it is used for"),
+    ("before_use", r"(what you need to know )?before you (take|use|are given)\b"),
+    ("dosage", r"how to (take|use)\b"),
+    ("side_effects", r"possible side[- ]effects"),
+    ("storage", r"how to store\b"),
+    ("contents", r"(contents of the pack and other information|further information)"),
+)
+# Mục con, chỉ nhận trong section "before_use" (dòng ngắn, không kết thúc bằng dấu chấm)
+SUBSECTIONS = (
+    ("contraindications", r"do not (take|use)\b"),
+    ("warnings", r"(warnings and precautions|take special care)\b"),
+    ("interactions", r"(taking |using )?other medicines\b"),
+    ("pregnancy", r"pregnancy(,| and) breast-?feeding"),
+    ("driving", r"driving and using machines"),
+)
+FIELDS = tuple(name for name, _ in SECTIONS + SUBSECTIONS) + ("tables",)
+
+_NUMBERED_RE = re.compile(r"^\s*(\d)\s*[.)]?\s+(.*)$")
+_SECTION_RES = [(name, re.compile(pattern, re.IGNORECASE)) for name, pattern in SECTIONS]
+_SUBSECTION_RES = [(name, re.compile(pattern, re.IGNORECASE)) for name, pattern in SUBSECTIONS]
+_TOKEN_RE = re.compile(r"\w{2,40}")
+SUBHEADING_MAX = 60
+
+
+def fields_path(index_path):
+    return os.path.splitext(index_path)[0] + ".fields.jsonl"
+
+
+def _heading(line, current):
+    """Return the section name if ``line`` is a heading, else None."""
+    m = _NUMBERED_RE.match(line)
+    if m:
+        for name, pattern in _SECTION_RES:
+            if pattern.match(m.group(2)):
+                return name
+    stripped = line.strip()
+    if current in ("before_use",) + tuple(name for name, _ in SUBSECTIONS) \
+            and len(stripped) <= SUBHEADING_MAX and not stripped.endswith("."):
+        for name, pattern in _SUBSECTION_RES:
+            if pattern.match(stripped):
+                return name
+    return None
+
+
+def segment(pages):
+    """Split a document's pages ({"page", "text"} dicts, in order) into [(section, page, text)].
+
+    A section spanning several pages yields one entry per page; text before the first
+    heading and empty sections (e.g. the "What is in this leaflet" list) are dropped.
+    """
+    entries = []
+    current, page_no, lines = None, None, []
+
+    def flush():
+        text = "\n".join(lines).strip()
+        if current and text:
+            entries.append((current, page_no, text))
+
+    for page in pages:
+        if lines:
+            flush()
+            lines = []
+        page_no = page.get("page") or 0
+        for line in (page.get("text") or "").splitlines():
+            name = _heading(line, current)
+            if name:
+                flush()
+                current, lines = name, []
+            else:
+                lines.append(line)
+    flush()
+    return entries
+
+
+def _tokens(text):
+    return set(_TOKEN_RE.findall(text.lower()))
+
+
+def table_text(rows):
+    return "\n".join(" | ".join(cell or "" for cell in row) for row in rows)
+
+
+class FieldIndex:
+    def __init__(self):
+        self.docs = {}          # rel_path → {"mtime", "sections": [(name, page, text)], "tables": [(page, fp, rows)]}
+        self._postings = None   # field → {token: {(rel_path, entry no)}}, dựng khi truy vấn lần đầu
+
+    # --- Build ---
+    def update_document(self, rel_path, mtime, pages, tables=()):
+        """Replace ``rel_path`` with the sections of ``pages`` and its ``tables`` [(page, fp, rows)]."""
+        self.docs[rel_path] = {"mtime": mtime, "sections": segment(pages),
+                               "tables": [(p, fp, rows) for p, fp, rows in tables]}
+        self._postings = None
+
+    def remove_document(self, rel_path):
+        if self.docs.pop(rel_path, None) is not None:
+            self._postings = None
+
+    def adopt(self, other, rel_paths):
+        """Copy the entries of ``rel_paths`` from another FieldIndex (e.g. a parallel run's)."""
+        for rel_path in rel_paths:
+            if rel_path in other.docs:
+                self.docs[rel_path] = other.docs[rel_path]
+                self._postings = None
+
+    def retain(self, rel_paths):
+        keep = set(rel_paths)
+        for rel_path in [p for p in self.docs if p not in keep]:
+            self.remove_document(rel_path)
+
+    def digest(self):
+        return listing_digest((p, d["mtime"]) for p, d in self.docs.items())
+
+    def page_tables(self, rel_path, page_fps):
+        """{fingerprint: [rows, ...]} for every page of an indexed document ({} if not in this index)."""
+        doc = self.docs.get(rel_path)
+        if doc is None:
+            return {}
+        tables = {fp: [] for fp in page_fps}
+        for _, fp, rows in doc["tables"]:
+            tables.setdefault(fp, []).append(rows)
+        return tables
+
+    # --- Persistence ---
+    def save(self, path):
+        fd, tmp_path = tempfile.mkstemp(prefix="index_", suffix=".tmp", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"schema": schema_header(), "digest": self.digest()}) + "\n")
+                for rel_path, doc in self.docs.items():
+                    f.write(json.dumps({"path": rel_path, **doc}, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @classmethod
+    def load(cls, path):
+        fi = cls()
+        with open(path, "r", encoding="utf-8") as f:
+            next(f, None)  # dòng meta
+            for line in f:
+                doc = json.loads(line)
+                fi.docs[doc.pop("path")] = {"mtime": doc["mtime"],
+                                            "sections": [tuple(s) for s in doc["sections"]],
+                                            "tables": [tuple(t) for t in doc["tables"]]}
+        return fi
+
+    # --- Query ---
+    def _entries(self, field):
+        for rel_path, doc in self.docs.items():
+            if field == "tables":
+                for n, (page, _, rows) in enumerate(doc["tables"]):
+                    yield rel_path, n, page, table_text(rows)
+            else:
+                for n, (name, page, text) in enumerate(doc["sections"]):
+                    if name == field:
+                        yield rel_path, n, page, text
+
+    def _entry(self, field, rel_path, n):
+        doc = self.docs[rel_path]
+        if field == "tables":
+            page, _, rows = doc["tables"][n]
+            return page, table_text(rows)
+        _, page, text = doc["sections"][n]
+        return page, text
+
+    def _build_postings(self):
+        self._postings = {field: {} for field in FIELDS}
+        for field in FIELDS:
+            vocab = self._postings[field]
+            for rel_path, n, _, text in self._entries(field):
+                for token in _tokens(text):
+                    vocab.setdefault(token, set()).add((rel_path, n))
+
+    def _candidates(self, field, query):
+        """Entries (rel_path, n) that may contain ``query``; None if the query has no token to look up.
+
+        Matching is by substring, like whole-page search, so each query token selects the entries
+        of every indexed token containing it ("aspir" → "aspirin").
+        """
+        vocab = self._postings[field]
+        candidates = None
+        for token in _tokens(query):
+            hits = set()
+            for word, entries in vocab.items():
+                if token in word:
+                    hits |= entries
+            candidates = hits if candidates is None else candidates & hits
+            if not candidates:
+                break
+        return candidates
+
+    def search(self, field, query):
+        """Return [(rel_path, page, text)] of ``field`` entries containing ``query`` (case-insensitive)."""
+        if field not in FIELDS:
+            raise ValueError(f"Unknown field: {field!r} (expected one of {FIELDS})")
+        if self._postings is None:
+            self._build_postings()
+        needle = query.lower()
+        if not needle:
+            return []
+        candidates = self._candidates(field, query)
+        if candidates is None:  # truy vấn không có token (vd. 1 ký tự) → quét cả field
+            entries = self._entries(field)
+        else:
+            entries = ((rel_path, n) + self._entry(field, rel_path, n) for rel_path, n in sorted(candidates))
+        return [(rel_path, page, text) for rel_path, n, page, text in entries if needle in text.lower()]
+
+
+def read_digest(path):
+    """Digest stored in the first line of a fields file (None if missing/unreadable)."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.loads(f.readline()).get("digest")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def open_field_index(path):
+    try:
+        return FieldIndex.load(path)
+    except (OSError, ValueError, KeyError):
+        return FieldIndex()
+
+
+# --- Main ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Section-scoped search over index.fields.jsonl.")
+    parser.add_argument('--path', type=str, default="../database/pdf-test",
+                        help='Folder containing index.json (default: ../database/pdf-test)')
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_query = sub.add_parser("query", help="search one field, e.g. query contraindications aspirin")
+    p_query.add_argument("field", choices=FIELDS)
+    p_query.add_argument("text")
+    p_show = sub.add_parser("show", help="print the sections found in one document")
+    p_show.add_argument("doc")
+    args = parser.parse_args()
+
+    index_json = os.path.join(os.path.abspath(args.path), "index.json")
+    if args.command == "query":
+        for rel_path, page, text in open_field_index(fields_path(index_json)).search(args.field, args.text):
+            i = text.lower().find(args.text.lower())
+            print(f"{rel_path}\tp.{page}\t{text[max(0, i - 40):i + 80]!r}")
+    else:
+        doc = open_field_index(fields_path(index_json)).docs.get(os.path.normpath(args.doc))
+        if doc is None:
+            # Chưa có trong index.fields.jsonl → tách section từ text trong index.json (không có bảng)
+            record = dict(iter_documents(index_json)).get(os.path.normpath(args.doc)) or {}
+            doc = {"sections": segment(record.get("pages") or []), "tables": []}
+        for name, page, text in doc["sections"]:
+            print(f"[{name}] p.{page}: {len(text)} chars")
+        for page, _, rows in doc["tables"]:
+            print(f"[table] p.{page}: {len(rows)} rows")
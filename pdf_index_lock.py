@@ -0,0 +1,152 @@
+import os, json, time, uuid, socket, threading
+
+# --- Writer lock (index.lock) ---
+# Nhiều người chạy indexer trên cùng một share, hoặc nhiều indexer song song trên các thư mục con
+# của một root: mọi lần ghi index.json (đọc lại – gộp – ghi) nằm trong index.lock.
+# Lock có hạn (lease): tiến trình chết giữa chừng thì sau LEASE_SECONDS người khác được phá lock.
+# Hạn tính theo đồng hồ của máy giữ lock → các máy dùng chung share nên đồng bộ giờ (NTP).
+# Trong lúc giữ lock, một thread nền gia hạn lease mỗi lease/3 giây → compact/replay chạy lâu không bị phá lock;
+# trước lần os.replace cuối, người ghi gọi verify() để chắc vẫn còn giữ lock.
+
+LEASE_SECONDS = 10 * 60
+POLL_SECONDS = 0.2
+
+
+class LockTimeout(RuntimeError):
+    """Raised when the index lock is still held by another writer after ``timeout`` seconds."""
+
+
+class LockLost(RuntimeError):
+    """Raised when a writer finds its lease was broken or taken over by another writer."""
+
+
+def lock_path(index_path):
+    return os.path.splitext(index_path)[0] + ".lock"
+
+
+def read_lock(path, lease=LEASE_SECONDS):
+    """Holder info {"owner", "token", "expires"} of a lock file (None if there is no lock).
+
+    A lock that cannot be parsed yet (being written) expires ``lease`` seconds after its mtime.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            holder = json.load(f)
+        if isinstance(holder, dict) and "expires" in holder:
+            return holder
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        return {"owner": "?", "token": None, "expires": os.path.getmtime(path) + lease}
+    except OSError:
+        return None
+
+
+class IndexLock:
+    """Exclusive lease on ``index.lock`` next to an index; use as ``with IndexLock(index_path): ...``."""
+
+    def __init__(self, index_path, lease=LEASE_SECONDS, timeout=None):
+        self.path = lock_path(index_path)
+        self.lease = lease
+        self.timeout = timeout  # None = chờ tới khi người giữ nhả lock hoặc lease hết hạn
+        self.token = None
+        self._stop = None
+        self._mutex = threading.Lock()  # gia hạn (thread nền) và nhả lock không chạy chồng nhau
+
+    def _create(self):
+        token = uuid.uuid4().hex
+        holder = {"owner": f"{socket.gethostname()}:{os.getpid()}", "token": token,
+                  "expires": time.time() + self.lease}
+        fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)  # FileExistsError nếu đã có người giữ
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(holder, f)
+        self.token = token
+
+    def held(self):
+        """True while the lock file still carries this writer's token."""
+        holder = read_lock(self.path, self.lease)
+        return self.token is not None and holder is not None and holder.get("token") == self.token
+
+    def verify(self):
+        """Raise :class:`LockLost` unless this writer still holds the lock (call before replacing files)."""
+        if not self.held():
+            raise LockLost(f"{self.path} is no longer held by this writer (lease expired or broken)")
+
+    def renew(self):
+        """Push the lease ``lease`` seconds into the future; returns False if the lock was lost."""
+        with self._mutex:
+            token = self.token
+            if not self.held():
+                return False
+            holder = {"owner": f"{socket.gethostname()}:{os.getpid()}", "token": token,
+                      "expires": time.time() + self.lease}
+            tmp_path = f"{self.path}.{token}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(holder, f)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                # file đang bị đọc (Windows) → thử lại ở nhịp sau, lease vẫn còn ≥ 2/3
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            return True
+
+    def _heartbeat(self, stop):
+        while not stop.wait(max(POLL_SECONDS, self.lease / 3)):
+            if not self.renew():
+                return
+
+    def _break(self, holder):
+        """Remove an expired lock, unless another writer replaced it in the meantime."""
+        stale = f"{self.path}.{uuid.uuid4().hex}.stale"
+        try:
+            os.rename(self.path, stale)
+        except OSError:
+            return  # đã bị người khác phá/nhả
+        if read_lock(stale, self.lease).get("token") != holder.get("token") and not os.path.exists(self.path):
+            os.rename(stale, self.path)  # lỡ lấy lock mới của người khác → trả lại
+            return
+        os.remove(stale)
+
+    def acquire(self):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            try:
+                self._create()
+            except FileExistsError:
+                pass
+            else:
+                self._stop = threading.Event()
+                threading.Thread(target=self._heartbeat, args=(self._stop,), daemon=True).start()
+                return self
+            holder = read_lock(self.path, self.lease)
+            if holder is None:
+                continue  # vừa được nhả
+            if holder["expires"] < time.time():
+                self._break(holder)
+                continue
+            if deadline is not None and time.monotonic() > deadline:
+                raise LockTimeout(f"{self.path} is held by {holder.get('owner')} "
+                                  f"(expires in {holder['expires'] - time.time():.0f}s)")
+            time.sleep(POLL_SECONDS)
+
+    def release(self):
+        """Remove the lock if this writer still holds it; returns False if the lease was lost."""
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+        with self._mutex:
+            held = self.held()
+            self.token = None
+            if held:
+                os.remove(self.path)
+            return held
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.release() and exc_type is None:
+            raise LockLost(f"{self.path} was lost before release; another writer may have changed the index")
@@ -0,0 +1,118 @@
+import os, json, time, queue, atexit, threading
+
+# --- Buffered log writer ---
+# Hot path chỉ gọi .log() (đưa vào queue); một thread nền gom theo lô,
+# ghi một lần, xoay vòng file theo dung lượng.
+
+LOG_FORMATS = ("text", "jsonl")
+ROTATE_STALE_SECONDS = 60  # file .rotating cũ hơn → writer giữ nó đã chết giữa chừng
+
+_STOP = object()
+
+
+class IndexLogger:
+    def __init__(self, path, fmt="text", max_bytes=5 * 1024 * 1024, backup_count=3,
+                 queue_size=10000, batch_size=500, flush_interval=0.5):
+        if fmt not in LOG_FORMATS:
+            raise ValueError(f"Unknown log format: {fmt!r} (expected one of {LOG_FORMATS})")
+        self.path = path
+        self.fmt = fmt
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._last_sec = None
+        self._last_stamp = ""
+        self._thread = threading.Thread(target=self._run, name=f"log:{os.path.basename(path)}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # --- Producer side ---
+    def log(self, message, level="INFO", **fields):
+        # Queue có giới hạn: khi đầy thì chặn (backpressure) thay vì làm mất log
+        self._queue.put((time.time(), level, message, fields))
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    # --- Writer thread ---
+    def _stamp(self, ts):
+        # strftime chỉ gọi một lần mỗi giây
+        sec = int(ts)
+        if sec != self._last_sec:
+            self._last_sec = sec
+            self._last_stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sec))
+        return self._last_stamp
+
+    def _format(self, record):
+        ts, level, message, fields = record
+        if self.fmt == "jsonl":
+            return json.dumps({"ts": self._stamp(ts), "level": level, "msg": message, **fields},
+                              ensure_ascii=False) + "\n"
+        return f"[{self._stamp(ts)}] {message}\n"
+
+    def _rotate(self, incoming):
+        # Nhiều tiến trình có thể ghi cùng một file (vd. hai indexer): chỉ tiến trình tạo được
+        # <path>.rotating mới xoay vòng, và kiểm tra lại dung lượng vì người khác có thể vừa xoay xong
+        marker = self.path + ".rotating"
+        try:
+            os.close(os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            if time.time() - os.path.getmtime(marker) > ROTATE_STALE_SECONDS:
+                os.remove(marker)
+            return
+        try:
+            if os.path.getsize(self.path) + incoming <= self.max_bytes:
+                return
+            for i in range(self.backup_count - 1, 0, -1):
+                src, dst = f"{self.path}.{i}", f"{self.path}.{i + 1}"
+                if os.path.exists(src):
+                    os.replace(src, dst)
+            if self.backup_count > 0:
+                os.replace(self.path, f"{self.path}.1")
+            else:
+                os.remove(self.path)
+        finally:
+            os.remove(marker)
+
+    def _write(self, batch):
+        data = "".join(self._format(r) for r in batch).encode("utf-8")
+        if self.max_bytes:
+            try:
+                if os.path.getsize(self.path) + len(data) > self.max_bytes:
+                    self._rotate(len(data))
+            except OSError:
+                # Không xoay vòng được (Windows: file đang được tiến trình khác mở) → vẫn ghi lô này,
+                # lần ghi sau thử xoay lại
+                pass
+        try:
+            with open(self.path, "ab") as f:
+                f.write(data)
+        except OSError:
+            pass  # log không được phép làm hỏng lần chạy index
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
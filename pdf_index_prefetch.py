@@ -0,0 +1,238 @@
+import os, io, json, mmap, time, hashlib, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Prefetch PDF bytes from slow (SMB/NFS) storage ---
+# Đọc trước các file sắp index bằng vài thread, giới hạn RAM và băng thông,
+# rồi đưa BytesIO/mmap cho pdfplumber thay vì để nó đọc lẻ tẻ qua mạng.
+# Có thể cache ra ổ SSD cục bộ; entry được dùng lại khi size + mtime khớp.
+# Cache có trần dung lượng: vượt trần thì xoá các bản sao lâu nhất chưa được dùng (LRU, theo mtime của file .json).
+
+BLOCK = 1024 * 1024
+CACHE_MAX_BYTES = 10 * 1024 * BLOCK
+
+
+class _Throttle:
+    """Token bucket shared by all reader threads (``rate`` bytes/second, None = unlimited)."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def consume(self, nbytes):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + nbytes / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+class _Budget:
+    """Bytes of prefetched data allowed in memory at once, handed out in file order.
+
+    Cấp theo thứ tự (ticket) để file đứng đầu hàng đợi không bị các file sau giành hết bộ nhớ.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._turn = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes, ticket):
+        with self._cond:
+            # Luôn cho phép ít nhất một file, kể cả khi nó lớn hơn limit
+            self._cond.wait_for(lambda: self._closed or (ticket == self._turn
+                                and (self.used == 0 or self.used + nbytes <= self.limit)))
+            self.used += nbytes
+            self._turn += 1
+            self._cond.notify_all()
+
+    def set_limit(self, limit):
+        with self._cond:
+            self.limit = limit
+            self._cond.notify_all()
+
+    def release(self, nbytes):
+        with self._cond:
+            self.used -= nbytes
+            self._cond.notify_all()
+
+    def close(self):
+        # Dừng sớm: ticket của file bị huỷ sẽ không bao giờ tới lượt → mở khoá mọi thread đang chờ
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class Prefetcher:
+    """Iterate ``rel_paths`` under ``folder`` as (rel_path, source) pairs, reading ahead in the background.
+
+    ``source`` is a BytesIO, an mmap of the local cache copy, or the absolute path when prefetching
+    failed. A source is only valid until the next item is requested.
+    """
+
+    def __init__(self, folder, rel_paths, workers=4, max_bytes=256 * BLOCK, bandwidth=None, cache_dir=None,
+                 cache_max_bytes=CACHE_MAX_BYTES):
+        self.folder = folder
+        self.rel_paths = list(rel_paths)
+        self.workers = max(1, workers)
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes  # None = không giới hạn
+        self._budget = _Budget(max_bytes)
+        self._throttle = _Throttle(bandwidth)
+        self._cache_lock = threading.Lock()
+        self._cache_used = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._cache_used = sum(size for _, _, size in self._cache_entries())
+
+    def set_max_bytes(self, max_bytes):
+        """Change the memory allowed for prefetched files (0 = one file at a time), e.g. under memory pressure."""
+        self._budget.set_limit(max_bytes)
+
+    # --- Reading ---
+    def _copy(self, src, dst):
+        """Copy ``src`` file object into ``dst`` in throttled blocks."""
+        while True:
+            block = src.read(BLOCK)
+            if not block:
+                break
+            self._throttle.consume(len(block))
+            dst.write(block)
+
+    def _cache_paths(self, abs_path):
+        key = hashlib.sha1(abs_path.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key + ".pdf"), os.path.join(self.cache_dir, key + ".json")
+
+    def _cache_entries(self):
+        """[(last used, data path, size)] of the copies in ``cache_dir``; copies without metadata sort first."""
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(".pdf"):
+                    continue
+                try:
+                    size = entry.stat().st_size
+                except OSError:
+                    continue
+                try:
+                    used = os.path.getmtime(entry.path[:-4] + ".json")
+                except OSError:
+                    used = 0.0  # bản sao mồ côi (ghi dở/không có .json) → xoá trước
+                entries.append((used, entry.path, size))
+        return entries
+
+    def _evict(self, keep):
+        """Delete least recently used copies (never ``keep``) until the cache fits ``cache_max_bytes``."""
+        for _, data_path, size in sorted(self._cache_entries()):
+            if self._cache_used <= self.cache_max_bytes:
+                break
+            if data_path == keep:
+                continue
+            try:
+                os.remove(data_path)  # Windows: bản sao đang mmap → lỗi → giữ lại
+            except OSError:
+                continue
+            self._cache_used -= size
+            try:
+                os.remove(data_path[:-4] + ".json")
+            except OSError:
+                pass
+
+    def _from_cache(self, abs_path, st):
+        data_path, meta_path = self._cache_paths(abs_path)
+        meta = {"path": abs_path, "size": st.st_size, "mtime": st.st_mtime}
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                hit = json.load(f) == meta
+        except (OSError, ValueError):
+            hit = False
+        if hit:
+            os.utime(meta_path)  # đánh dấu vừa dùng (LRU)
+        else:
+            try:
+                old_size = os.path.getsize(data_path)
+            except OSError:
+                old_size = 0
+            tmp_path = data_path + ".tmp"
+            with open(abs_path, "rb") as src, open(tmp_path, "wb") as dst:
+                self._copy(src, dst)
+            os.replace(tmp_path, data_path)
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            with self._cache_lock:
+                self._cache_used += st.st_size - old_size
+                if self.cache_max_bytes is not None and self._cache_used > self.cache_max_bytes:
+                    self._evict(keep=data_path)
+        with open(data_path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if st.st_size else io.BytesIO(b""), 0
+
+    def _fetch(self, rel_path, ticket):
+        """Return (source, bytes held in memory)."""
+        abs_path = os.path.join(self.folder, rel_path)
+        try:
+            st = os.stat(abs_path)
+        except OSError:
+            st = None
+        if self.cache_dir:
+            try:
+                return self._from_cache(abs_path, st) if st else (abs_path, 0)
+            except OSError:
+                return abs_path, 0
+        size = st.st_size if st else 0
+        self._budget.acquire(size, ticket)
+        try:
+            if st is None:
+                raise OSError(abs_path)
+            buf = io.BytesIO()
+            with open(abs_path, "rb") as src:
+                self._copy(src, buf)
+            buf.seek(0)
+            return buf, size
+        except OSError:
+            self._budget.release(size)
+            return abs_path, 0  # để extractor tự mở (và tự báo lỗi nếu có)
+
+    # --- Iteration ---
+    def __iter__(self):
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prefetch") as executor:
+            pending = deque()
+            rel_paths = iter(enumerate(self.rel_paths))
+            try:
+                while True:
+                    # Đọc trước tối đa 2 × workers file
+                    while len(pending) < 2 * self.workers:
+                        item = next(rel_paths, None)
+                        if item is None:
+                            break
+                        ticket, rel_path = item
+                        pending.append((rel_path, executor.submit(self._fetch, rel_path, ticket)))
+                    if not pending:
+                        break
+                    rel_path, future = pending.popleft()
+                    source, nbytes = future.result()
+                    try:
+                        yield rel_path, source
+                    finally:
+                        self._release(source, nbytes)  # file trước đã xử lý xong → trả bộ nhớ
+            finally:
+                self._budget.close()
+                for _, future in pending:
+                    future.cancel()
+                    future.add_done_callback(self._discard)
+
+    def _discard(self, future):
+        if not future.cancelled():
+            self._release(*future.result())
+
+    def _release(self, source, nbytes):
+        if hasattr(source, "close"):
+            source.close()
+        if nbytes:
+            self._budget.release(nbytes)
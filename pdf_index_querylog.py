@@ -0,0 +1,166 @@
+import os, json, time, argparse, statistics
+from contextlib import contextmanager
+from pdf_index_store import load_index, search_pages
+
+# --- Search timing & slow-query log ---
+# Đo thời gian từng pha của một lần tìm kiếm trong PDF_Index_Search.py (nạp index, tìm, kiểm tra
+# file còn tồn tại, hiển thị). Truy vấn chậm hơn SLOW_QUERY_MS được ghi vào index.slow_queries.jsonl;
+# lệnh replay chạy lại các truy vấn đó trên một bản index mới để so sánh độ trễ.
+
+MODES = ("keyword", "section", "semantic")
+PHASES = ("load", "search", "check_files", "render")
+REPLAY_PHASES = ("search", "check_files")  # load được cache trong app, render cần Streamlit
+SLOW_QUERY_MS = 500
+
+
+class PhaseTimer:
+    """Wall time of the named phases of one search, in milliseconds."""
+
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    @property
+    def total(self):
+        return sum(self.phases.values())
+
+
+def slow_log_path(index_path):
+    return os.path.splitext(index_path)[0] + ".slow_queries.jsonl"
+
+
+def query_mode(section=None, semantic=False):
+    return "section" if section else "semantic" if semantic else "keyword"
+
+
+# --- Search (shared by the app and replay) ---
+def load_for(index_path, mode):
+    """Load what a search ``mode`` runs against: the index, the fields file or the semantic index."""
+    if mode == "section":
+        from pdf_index_fields import fields_path, open_field_index
+        return open_field_index(fields_path(index_path))
+    if mode == "semantic":
+        from pdf_index_semantic import SemanticIndex  # numpy/model chỉ nạp khi cần
+        return SemanticIndex(index_path)
+    return load_index(index_path)
+
+
+def search_loaded(data, mode, query, section=None):
+    """Run ``query`` against ``data`` from :func:`load_for`; returns [(rel_path, page, text)]."""
+    if mode == "section":
+        return data.search(section, query)
+    if mode == "semantic":
+        return [(rel_path, page_no, text) for _, rel_path, page_no, text in data.search(query, k=50)]
+    return [(doc.path, page_no, text) for doc, page_no, text in search_pages(data, query)]
+
+
+def existing_hits(folder, hits):
+    """Keep the hits whose file (PDF/picture) still exists under ``folder``."""
+    exists = {}
+    results = []
+    for rel_path, page_no, text in hits:
+        if rel_path not in exists:
+            exists[rel_path] = os.path.exists(os.path.join(folder, rel_path))
+        if exists[rel_path]:
+            results.append((rel_path, page_no, text))
+    return results
+
+
+# --- Slow-query log ---
+def log_query(logger, query, mode, section, hits, timer, threshold_ms=SLOW_QUERY_MS):
+    """Write one search to ``logger`` (an IndexLogger in jsonl format) if it took ``threshold_ms`` or more."""
+    if timer.total < threshold_ms:
+        return False
+    logger.log("slow query", query=query, mode=mode, section=section, hits=hits,
+               total_ms=round(timer.total, 1), phases={k: round(v, 1) for k, v in timer.phases.items()})
+    return True
+
+
+def read_slow_log(path):
+    """Logged queries (dicts) from a slow-query log and its rotated copies, oldest first."""
+    entries = []
+    for p in sorted((f"{path}.{i}" for i in range(1, 10) if os.path.exists(f"{path}.{i}")), reverse=True) + [path]:
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # dòng ghi dở
+                    if isinstance(entry, dict) and entry.get("query") and entry.get("mode") in MODES:
+                        entries.append(entry)
+        except OSError:
+            pass
+    return entries
+
+
+def replay(index_path, entries, repeat=3, log=print):
+    """Re-run logged queries against ``index_path``; returns [(entry, new phases ms, new hit count)].
+
+    Each query runs ``repeat`` times and keeps its fastest time; loading is timed once per mode.
+    """
+    folder = os.path.dirname(index_path)
+    loaded = {}
+    results = []
+    for entry in entries:
+        mode, section = entry["mode"], entry.get("section")
+        if mode not in loaded:
+            start = time.perf_counter()
+            loaded[mode] = load_for(index_path, mode)
+            log(f"📂 Loaded {mode} data in {(time.perf_counter() - start) * 1000:.0f} ms")
+        best, hits = None, []
+        for _ in range(max(1, repeat)):
+            timer = PhaseTimer()
+            with timer.phase("search"):
+                found = search_loaded(loaded[mode], mode, entry["query"], section)
+            with timer.phase("check_files"):
+                hits = existing_hits(folder, found)
+            if best is None or timer.total < sum(best.values()):
+                best = timer.phases
+        results.append((entry, best, len(hits)))
+    return results
+
+
+def _replayed_ms(phases):
+    return sum((phases or {}).get(name, 0.0) for name in REPLAY_PHASES)
+
+
+# --- Main ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect the slow-query log and replay it against an index build.")
+    parser.add_argument('--path', type=str, default="../database/pdf-test",
+                        help='Folder containing index.json to run against (default: ../database/pdf-test)')
+    parser.add_argument('--log', type=str, default=None,
+                        help='Slow-query log to read (default: index.slow_queries.jsonl in --path)')
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_top = sub.add_parser("top", help="print the slowest logged queries")
+    p_top.add_argument("-n", type=int, default=20)
+    p_replay = sub.add_parser("replay", help="re-run logged queries and compare latency with the log")
+    p_replay.add_argument("--repeat", type=int, default=3, help="runs per query, fastest is kept (default: 3)")
+    args = parser.parse_args()
+
+    index_json = os.path.join(os.path.abspath(args.path), "index.json")
+    entries = read_slow_log(args.log or slow_log_path(index_json))
+    if not entries:
+        raise SystemExit("No logged queries found.")
+    if args.command == "top":
+        for e in sorted(entries, key=lambda e: -e.get("total_ms", 0))[:args.n]:
+            phases = " ".join(f"{k}={v:.0f}" for k, v in (e.get("phases") or {}).items())
+            print(f"{e.get('total_ms', 0):>8.0f} ms  {e['mode']:<8} {e.get('hits', '?'):>5} hits  {e['query']!r}  [{phases}]")
+    else:
+        old_ms, new_ms = [], []
+        for entry, phases, hits in replay(index_json, entries, repeat=args.repeat):
+            old, new = _replayed_ms(entry.get("phases")), _replayed_ms(phases)
+            old_ms.append(old)
+            new_ms.append(new)
+            print(f"{old:>8.0f} → {new:>8.0f} ms  {entry.get('hits', '?'):>5} → {hits:<5} hits  "
+                  f"{entry['mode']:<8} {entry['query']!r}")
+        print(f"✅ {len(entries)} queries | median {' + '.join(REPLAY_PHASES)}: "
+              f"{statistics.median(old_ms):.0f} ms (logged) → {statistics.median(new_ms):.0f} ms (this index)")
@@ -0,0 +1,97 @@
+import os, time, heapq
+
+# --- Indexing scheduler ---
+# Quyết định thứ tự index: chính sách trong từng thư mục gốc (walk/newest/smallest),
+# thư mục ưu tiên, chia lượt công bằng giữa nhiều thư mục gốc, và ngân sách thời gian/trang mỗi lần chạy.
+
+POLICIES = ("walk", "newest", "smallest")
+
+
+class Task:
+    __slots__ = ("job", "rel_path", "abs_path", "mtime", "size", "priority")
+
+    def __init__(self, job, rel_path, abs_path, mtime, size):
+        self.job = job
+        self.rel_path = rel_path
+        self.abs_path = abs_path
+        self.mtime = mtime
+        self.size = size
+        self.priority = 0
+
+
+def _priority_rank(rel_path, priority_dirs):
+    """Index of the first priority folder containing ``rel_path`` (len(priority_dirs) if none)."""
+    path = os.path.normcase(os.path.normpath(rel_path))
+    for rank, folder in enumerate(priority_dirs):
+        if path.startswith(folder + os.sep):
+            return rank
+    return len(priority_dirs)
+
+
+def _normalize_dirs(root, priority_dirs):
+    dirs = []
+    for d in priority_dirs:
+        if os.path.isabs(d):
+            d = os.path.relpath(d, root)  # thư mục ưu tiên nằm ngoài root sẽ không khớp file nào
+        dirs.append(os.path.normcase(os.path.normpath(d)))
+    return dirs
+
+
+def within_dirs(rel_paths, root, dirs):
+    """Keep the ``rel_paths`` lying under one of ``dirs`` (relative to ``root`` or absolute)."""
+    dirs = _normalize_dirs(root, dirs)
+    return [p for p in rel_paths if _priority_rank(p, dirs) < len(dirs)]
+
+
+def order_tasks(tasks, root, policy="walk", priority_dirs=()):
+    """Return ``tasks`` of one root ordered by priority folder first, then by ``policy``."""
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy: {policy!r} (expected one of {POLICIES})")
+    dirs = _normalize_dirs(root, priority_dirs)
+    for task in tasks:
+        task.priority = _priority_rank(task.rel_path, dirs)
+    if policy == "newest":
+        key = lambda t: (t.priority, -t.mtime)
+    elif policy == "smallest":
+        key = lambda t: (t.priority, t.size)
+    else:
+        key = lambda t: t.priority  # sort ổn định → giữ thứ tự os.walk trong cùng mức ưu tiên
+    return sorted(tasks, key=key)
+
+
+def fair_merge(queues):
+    """Interleave ordered per-root task lists so each root gets a fair share of work.
+
+    The next task always comes from the root with the fewest bytes scheduled so far,
+    so a root with a huge backlog cannot starve a root with a few fresh files.
+    """
+    heap = [(0, i) for i, q in enumerate(queues) if q]
+    heapq.heapify(heap)
+    positions = [0] * len(queues)
+    merged = []
+    while heap:
+        scheduled, i = heapq.heappop(heap)
+        task = queues[i][positions[i]]
+        positions[i] += 1
+        merged.append(task)
+        if positions[i] < len(queues[i]):
+            heapq.heappush(heap, (scheduled + max(1, task.size), i))
+    return merged
+
+
+class RunBudget:
+    """Stop a run after ``max_seconds`` of wall time or ``max_pages`` extracted pages (None = no limit)."""
+
+    def __init__(self, max_seconds=None, max_pages=None):
+        self.max_seconds = max_seconds
+        self.max_pages = max_pages
+        self.pages = 0
+        self._start = time.monotonic()
+
+    def charge(self, pages):
+        self.pages += pages
+
+    def exhausted(self):
+        if self.max_pages is not None and self.pages >= self.max_pages:
+            return True
+        return self.max_seconds is not None and time.monotonic() - self._start >= self.max_seconds
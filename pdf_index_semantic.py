@@ -0,0 +1,224 @@
+import os, re, hashlib, argparse
+from collections import deque
+import numpy as np
+from pdf_index_store import load_index
+
+# --- Semantic search (tuỳ chọn, chạy CPU, offline) ---
+# Trang được cắt thành chunk theo số từ, embed bằng model sentence-transformers nhỏ,
+# cache theo hash của chunk (index.embeddings.npz) nên lần index sau chỉ embed chunk mới/đổi.
+# ANN: hnswlib (HNSW) nếu có, nếu không thì tích vô hướng numpy trên toàn bộ vector.
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+CHUNK_WORDS = 200
+CHUNK_OVERLAP = 40
+_WORD_RE = re.compile(r"\w+")
+
+
+def embeddings_path(index_path):
+    return os.path.splitext(index_path)[0] + ".embeddings.npz"
+
+
+def ann_path(index_path):
+    return os.path.splitext(index_path)[0] + ".embeddings.hnsw"
+
+
+def chunk_hash(model_name, text):
+    return hashlib.sha1(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+def iter_chunks(index):
+    """Yield (rel_path, page_no, chunk_text) for every chunk of every page in a PdfIndex."""
+    step = CHUNK_WORDS - CHUNK_OVERLAP
+    for doc in index:
+        for page_no, text in doc.iter_pages():
+            words = text.split()
+            for start in range(0, max(1, len(words) - CHUNK_OVERLAP), step):
+                chunk = " ".join(words[start:start + CHUNK_WORDS])
+                if chunk:
+                    yield doc.path, page_no, chunk
+
+
+def load_model(model_name=DEFAULT_MODEL):
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        raise RuntimeError("Semantic search needs sentence-transformers: pip install sentence-transformers")
+    return SentenceTransformer(model_name, device="cpu")
+
+
+def _read_cache(path):
+    """Return (model_name, {hash: vector}) from an embeddings file, or (None, {})."""
+    if not os.path.exists(path):
+        return None, {}
+    with np.load(path) as z:
+        return str(z["model"]), dict(zip(z["hashes"].tolist(), z["vectors"]))
+
+
+def _write_cache(path, model_name, hashes, vectors):
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, model=np.array(model_name), hashes=np.array(hashes, dtype="U40"),
+             vectors=vectors.astype(np.float32))
+    os.replace(tmp_path, path)
+
+
+def _build_ann(vectors, path):
+    try:
+        import hnswlib
+    except ImportError:
+        hnswlib = None
+    if hnswlib is None or not len(vectors):
+        if os.path.exists(path):
+            os.remove(path)  # ANN cũ không còn khớp với vector mới
+        return None
+    ann = hnswlib.Index(space="ip", dim=vectors.shape[1])
+    ann.init_index(max_elements=len(vectors), ef_construction=200, M=16)
+    ann.add_items(vectors, np.arange(len(vectors)))
+    ann.save_index(path)
+    return ann
+
+
+def _store(index_path, model_name, chunks, cached):
+    """Write vectors for ``chunks`` (all present in ``cached``) and rebuild the ANN index."""
+    hashes = [chunk_hash(model_name, text) for _, _, text in chunks]
+    dim = len(next(iter(cached.values()))) if cached else 0
+    vectors = np.array([cached[h] for h in hashes], dtype=np.float32).reshape(len(hashes), dim)
+    _write_cache(embeddings_path(index_path), model_name, hashes, vectors)
+    _build_ann(vectors, ann_path(index_path))
+    return len(hashes)
+
+
+def build(index_path, model_name=DEFAULT_MODEL, batch_size=32, log=print):
+    """Embed every chunk of ``index_path`` that is not cached yet; returns (chunks, newly_embedded)."""
+    chunks = list(iter_chunks(load_index(index_path)))
+    cached_model, cached = _read_cache(embeddings_path(index_path))
+    if cached_model != model_name:
+        cached = {}
+    missing = {}
+    for _, _, text in chunks:
+        h = chunk_hash(model_name, text)
+        if h not in cached:
+            missing[h] = text
+    if missing:
+        log(f"🧠 Embedding {len(missing)} new chunk(s) with {model_name}")
+        model = load_model(model_name)
+        items = list(missing.items())
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            vecs = model.encode([t for _, t in batch], batch_size=batch_size,
+                                normalize_embeddings=True, convert_to_numpy=True)
+            cached.update(zip((h for h, _ in batch), vecs))
+    # Chỉ giữ vector của chunk hiện có → cache không phình theo thời gian
+    _store(index_path, model_name, chunks, cached)
+    return len(chunks), len(missing)
+
+
+def prune(index_path):
+    """Drop cached vectors of chunks no longer in the index and rebuild the ANN (no model needed)."""
+    cached_model, cached = _read_cache(embeddings_path(index_path))
+    if cached_model is None:
+        return 0
+    chunks = [c for c in iter_chunks(load_index(index_path)) if chunk_hash(cached_model, c[2]) in cached]
+    before = len(cached)
+    _store(index_path, cached_model, chunks, cached)
+    return before - len({chunk_hash(cached_model, c[2]) for c in chunks})
+
+
+# --- Query ---
+class SemanticIndex:
+    def __init__(self, index_path, model=None):
+        path = embeddings_path(index_path)
+        with np.load(path) as z:
+            self.model_name = str(z["model"])
+            self.hashes = z["hashes"].tolist()
+            self.vectors = z["vectors"]
+        # _store ghi một dòng cho mỗi chunk theo thứ tự index, kể cả chunk trùng văn bản (cùng leaflet ở
+        # hai thư mục, đoạn boilerplate) → dòng thứ k của một hash ứng với chunk thứ k có hash đó
+        by_hash = {}
+        for c in iter_chunks(load_index(index_path)):
+            by_hash.setdefault(chunk_hash(self.model_name, c[2]), deque()).append(c)
+        self.chunks = [by_hash[h].popleft() if by_hash.get(h) else None  # None = chunk không còn trong index
+                       for h in self.hashes]
+        # token → các dòng chunk chứa token: điểm keyword chỉ xét các dòng này, không quét cả corpus
+        self.postings = {}
+        for row, chunk in enumerate(self.chunks):
+            if chunk:
+                for token in set(_WORD_RE.findall(chunk[2].lower())):
+                    self.postings.setdefault(token, []).append(row)
+        self.model = model
+        self.ann = None
+        if os.path.exists(ann_path(index_path)) and len(self.hashes):
+            try:
+                import hnswlib
+                self.ann = hnswlib.Index(space="ip", dim=self.vectors.shape[1])
+                self.ann.load_index(ann_path(index_path), max_elements=len(self.hashes))
+            except ImportError:
+                self.ann = None
+
+    def _embed(self, query):
+        if self.model is None:
+            self.model = load_model(self.model_name)
+        return self.model.encode([query], normalize_embeddings=True, convert_to_numpy=True)[0].astype(np.float32)
+
+    def nearest(self, query_vec, k):
+        """Return [(row, cosine similarity)] of the ``k`` nearest chunks."""
+        k = min(k, len(self.hashes))
+        if k == 0:
+            return []
+        if self.ann is not None:
+            self.ann.set_ef(max(64, k))  # ef >= k để HNSW trả đủ k kết quả
+            labels, distances = self.ann.knn_query(query_vec, k=k)
+            return [(int(r), 1.0 - float(d)) for r, d in zip(labels[0], distances[0])]
+        scores = self.vectors @ query_vec
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [(int(r), float(scores[r])) for r in top[np.argsort(-scores[top])]]
+
+    def search(self, query, k=20, alpha=0.7):
+        """Hybrid search: ``alpha`` × cosine similarity + (1 − ``alpha``) × keyword overlap.
+
+        Returns [(score, rel_path, page_no, chunk_text)] best first.
+        """
+        q_vec = self._embed(query)
+        q_tokens = set(_WORD_RE.findall(query.lower()))
+        sem = dict(self.nearest(q_vec, k * 5))
+        overlap = {}  # dòng → số token của truy vấn có trong chunk
+        for token in q_tokens:
+            for row in self.postings.get(token, ()):
+                overlap[row] = overlap.get(row, 0) + 1
+        if alpha < 1:
+            # Chunk có chứa từ khoá nhưng nằm ngoài top ANN vẫn được xếp hạng
+            for row in overlap:
+                if row not in sem:
+                    sem[row] = float(self.vectors[row] @ q_vec)
+        results = []
+        for row, sim in sem.items():
+            chunk = self.chunks[row]
+            if chunk is None:
+                continue
+            kw = overlap.get(row, 0) / len(q_tokens) if q_tokens else 0.0
+            results.append((alpha * sim + (1 - alpha) * kw, chunk[0], chunk[1], chunk[2]))
+        results.sort(key=lambda r: r[0], reverse=True)
+        return results[:k]
+
+
+# --- Main ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local semantic search over a PDF index.")
+    parser.add_argument('--path', type=str, default="../database/pdf-test",
+                        help='Folder containing index.json (default: ../database/pdf-test)')
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_build = sub.add_parser("build", help="embed new/changed chunks and rebuild the ANN index")
+    p_build.add_argument("--model", default=DEFAULT_MODEL)
+    p_build.add_argument("--batch-size", type=int, default=32)
+    p_query = sub.add_parser("query", help="hybrid semantic + keyword search")
+    p_query.add_argument("query")
+    p_query.add_argument("-k", type=int, default=10)
+    p_query.add_argument("--alpha", type=float, default=0.7, help='Weight of semantic vs keyword score (default: 0.7)')
+    args = parser.parse_args()
+
+    index_json = os.path.join(os.path.abspath(args.path), "index.json")
+    if args.command == "build":
+        total, embedded = build(index_json, args.model, args.batch_size)
+        print(f"✅ Done. Chunks: {total} | Newly embedded: {embedded}")
+    else:
+        for score, rel_path, page_no, text in SemanticIndex(index_json).search(args.query, args.k, args.alpha):
+            print(f"{score:.3f}\t{rel_path}\tp.{page_no}\t{text[:80]!r}")
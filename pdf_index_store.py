@@ -0,0 +1,524 @@
+import os, json, re, time, hashlib, tempfile
+from array import array
+
+# --- Schema ---
+# index.json (v2) giữ nguyên dạng của indexer: {rel_path: {"_mtime", "pages": [...]}}
+# và thêm một key kỹ thuật "_schema" (các key bắt đầu bằng "_" không phải đường dẫn).
+SCHEMA_KEY = "_schema"
+SCHEMA_NAME = "pharmapp-pdf-index"
+SCHEMA_VERSION = 2
+
+
+class IndexFormatError(ValueError):
+    """Raised when an index file is corrupt or in an unknown layout."""
+
+
+class IndexVersionError(IndexFormatError):
+    """Raised when an index was written by a newer schema than this code understands."""
+
+
+def schema_header():
+    return {"name": SCHEMA_NAME, "version": SCHEMA_VERSION}
+
+
+# --- Compact in-memory records ---
+class DocRecord:
+    __slots__ = ("path", "mtime", "page_nos", "texts")
+
+    def __init__(self, path, mtime, page_nos, texts):
+        self.path = path
+        self.mtime = mtime
+        self.page_nos = page_nos  # array('I'); 0 = page number unknown
+        self.texts = texts        # tuple[str], aligned with page_nos
+
+    def __len__(self):
+        return len(self.texts)
+
+    def iter_pages(self):
+        return zip(self.page_nos, self.texts)
+
+
+class PdfIndex:
+    __slots__ = ("source", "docs")
+
+    def __init__(self, source=None):
+        self.source = source
+        self.docs = {}
+
+    def __len__(self):
+        return len(self.docs)
+
+    def __iter__(self):
+        return iter(self.docs.values())
+
+    def get(self, path):
+        return self.docs.get(path)
+
+    def page_count(self):
+        return sum(len(d) for d in self.docs.values())
+
+
+# --- Legacy layouts → v2 record ---
+_PAGE_IN_NAME = re.compile(r'page_(\d+)')
+
+
+def _normalize_entry(key, value):
+    """Return a v2 record {"_mtime", "pages"} for any known legacy entry, or None."""
+    if isinstance(value, dict) and "pages" in value:
+        return value  # v1/v2 indexer layout
+    if isinstance(value, str):
+        # code-archives GUI: {rel_path: lowercased_full_text}
+        return {"_mtime": None, "pages": [{"page": 0, "text": value}]}
+    return None
+
+
+def _normalize_list_item(item):
+    # PDF_Index_Search (OCR ảnh) cũ: [{"filename", "text"}]
+    if not isinstance(item, dict) or "filename" not in item:
+        return None, None
+    m = _PAGE_IN_NAME.search(item["filename"])
+    page = int(m.group(1)) if m else 0
+    return item["filename"], {"_mtime": None, "pages": [{"page": page, "text": item.get("text") or ""}]}
+
+
+def _first_token(f):
+    """First non-whitespace character of a file opened in binary mode ("" if empty)."""
+    while True:
+        ch = f.read(1)
+        if not ch:
+            return ""
+        if not ch.isspace():
+            f.seek(0)
+            return chr(ch[0])
+
+
+def _iter_raw(f, first):
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
+
+    if ijson is None:
+        data = json.load(f)  # bytes UTF-8 → json tự giải mã
+        if isinstance(data, dict):
+            yield from data.items()
+        else:
+            yield from ((None, item) for item in data)
+        return
+
+    try:
+        if first == "{":
+            yield from ijson.kvitems(f, "", use_float=True)
+        else:
+            yield from ((None, item) for item in ijson.items(f, "item", use_float=True))
+    except ijson.JSONError as e:
+        raise IndexFormatError(str(e)) from e
+
+
+def iter_documents(path):
+    """Stream (rel_path, record) pairs from an index file of any known layout.
+
+    Records are normalized to the v2 shape ``{"_mtime": float|None, "pages": [{"page", "text"}]}``.
+    Uses ijson for incremental parsing when it is installed, plain json otherwise.
+    """
+    # ijson đọc bytes (mở text mode → DeprecationWarning và chậm hơn)
+    with open(path, "rb") as f:
+        first = _first_token(f)
+        if first not in ("{", "["):
+            raise IndexFormatError(f"{path}: index must be a JSON object or array")
+        try:
+            for key, value in _iter_raw(f, first):
+                if key is None:
+                    key, record = _normalize_list_item(value)
+                elif key.startswith("_"):
+                    if key == SCHEMA_KEY and isinstance(value, dict) \
+                            and value.get("version", SCHEMA_VERSION) > SCHEMA_VERSION:
+                        raise IndexVersionError(f"{path}: unsupported index schema version {value.get('version')}")
+                    continue
+                else:
+                    record = _normalize_entry(key, value)
+                if record is not None:
+                    yield key, record
+        except json.JSONDecodeError as e:
+            raise IndexFormatError(str(e)) from e
+
+
+def load_index(path):
+    """Load an index file into a compact :class:`PdfIndex`."""
+    index = PdfIndex(source=path)
+    for rel_path, record in iter_documents(path):
+        pages = [p for p in record.get("pages") or [] if isinstance(p, dict)]
+        index.docs[rel_path] = DocRecord(
+            rel_path,
+            record.get("_mtime"),
+            array("I", (int(p.get("page") or 0) for p in pages)),
+            tuple(p.get("text") or "" for p in pages),
+        )
+    return index
+
+
+def load_index_dict(path):
+    """Load an index file as a mutable ``{rel_path: record}`` dict (for writers)."""
+    return dict(iter_documents(path))
+
+
+def load_index_meta(path):
+    """Like :func:`load_index_dict`, but page lists stay on disk as :class:`StoredPages`.
+
+    Only works for indexes written by :func:`save_index` (one document per line); other
+    layouts are loaded in full.
+    """
+    decoder = json.JSONDecoder()
+    index_data = {}
+    with open(path, "rb") as f:
+        if f.readline().strip() != b"{":
+            return load_index_dict(path)
+        stamp = file_stamp(f.fileno())
+        pos = f.tell()
+        for raw in f:
+            line_start, pos = pos, pos + len(raw)
+            line = raw.rstrip(b"\r\n").rstrip(b",").decode("utf-8")
+            if not line.startswith('"'):
+                if line.strip() in ("", "}"):
+                    continue
+                return load_index_dict(path)  # không phải layout mỗi dòng một tài liệu
+            try:
+                key, end = decoder.raw_decode(line)
+                record = json.loads(line[end + 2:])
+            except ValueError as e:
+                raise IndexFormatError(f"{path}: {e}") from e
+            if key.startswith("_"):
+                if key == SCHEMA_KEY and isinstance(record, dict) and record.get("version", SCHEMA_VERSION) > SCHEMA_VERSION:
+                    raise IndexVersionError(f"{path}: unsupported index schema version {record.get('version')}")
+                continue
+            if not isinstance(record, dict) or not isinstance(record.get("pages"), list):
+                record = _normalize_entry(key, record)
+                if record is None:
+                    continue
+                index_data[key] = record
+                continue
+            offset = line_start + len(line[:end + 2].encode("utf-8"))
+            length = len(line[end + 2:].encode("utf-8"))
+            record["pages"] = StoredPages(path, offset, length, len(record["pages"]), stamp)
+            index_data[key] = record
+    return index_data
+
+
+# --- Page spool ---
+class PageSpool:
+    """Pages of one document kept in a JSON-lines file instead of in memory.
+
+    Can stand in for the ``pages`` list of a record passed to :func:`save_index`.
+    """
+    __slots__ = ("path", "count", "_f")
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._f = open(path, "w", encoding="utf-8")
+
+    def append(self, page):
+        self._f.write(json.dumps(page, ensure_ascii=False) + "\n")
+        self.count += 1
+
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
+
+    def discard(self):
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        self.close()
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+
+def file_stamp(path_or_fd):
+    """(size, mtime_ns) of a file; changes whenever the file is rewritten or replaced."""
+    st = os.fstat(path_or_fd) if isinstance(path_or_fd, int) else os.stat(path_or_fd)
+    return st.st_size, st.st_mtime_ns
+
+
+class StoredPages:
+    """Pages of one record left in a saved index file and read back on each iteration.
+
+    Produced by :func:`load_index_meta` and by :func:`save_index`; like PageSpool it can stand
+    in for a record's ``pages`` list, so only metadata stays in memory.
+    """
+    __slots__ = ("path", "offset", "length", "count", "stamp")
+
+    def __init__(self, path, offset, length, count, stamp):
+        self.path = path
+        self.offset = offset    # vị trí byte của bản ghi (JSON) trong file
+        self.length = length
+        self.count = count
+        self.stamp = stamp      # file_stamp của file lúc lấy offset
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            # Một writer khác đã thay index.json → offset không còn đúng
+            if file_stamp(f.fileno()) != self.stamp:
+                raise IndexFormatError(f"{self.path} was replaced after it was read; reload it")
+            f.seek(self.offset)
+            record = json.loads(f.read(self.length).decode("utf-8"))
+        return iter(record.get("pages") or [])
+
+
+# --- Header ---
+# index.header.json: file nhỏ đi kèm index.json (số lượng, version, danh sách shard,
+# digest của các cặp (path, mtime)) để biết "không có gì thay đổi" mà không phải đọc index.
+def header_path(index_path):
+    return os.path.splitext(index_path)[0] + ".header.json"
+
+
+def listing_digest(path_mtimes):
+    """Digest of (rel_path, mtime) pairs; equal digests mean the same files at the same mtimes."""
+    h = hashlib.sha1()
+    for rel_path, mtime in sorted(path_mtimes):
+        h.update(f"{rel_path}\0{mtime!r}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _read_header_file(index_path):
+    try:
+        with open(header_path(index_path), "r", encoding="utf-8") as f:
+            header = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return header if isinstance(header, dict) else None
+
+
+def read_header(index_path):
+    """Return the header of ``index_path``, or None if it is missing or out of date."""
+    header = _read_header_file(index_path)
+    try:
+        st = os.stat(index_path)
+    except OSError:
+        return None
+    if header is None or (header.get("index_size"), header.get("index_mtime_ns")) != (st.st_size, st.st_mtime_ns):
+        return None  # index.json được ghi bởi công cụ khác sau header
+    return header
+
+
+def refresh_header(index_path, index_data, previous=None, version=None):
+    """(Re)write the header for an ``index_path`` whose content is ``index_data``.
+
+    The version is bumped from ``previous`` unless an explicit ``version`` is given.
+    """
+    if previous is None:
+        previous = _read_header_file(index_path)
+    docs = [(k, v) for k, v in index_data.items() if isinstance(k, str) and not k.startswith("_")]
+    st = os.stat(index_path)
+    header = {
+        "schema": schema_header(),
+        "version": version if version is not None else (previous or {}).get("version", 0) + 1,
+        "documents": len(docs),
+        "pages": sum(len(v.get("pages") or []) for _, v in docs),
+        "failed": sum(1 for _, v in docs if v.get("_error")),  # file lỗi, ghi lại để không parse lại mỗi lần
+        "shards": [os.path.basename(index_path)],
+        "digest": listing_digest((k, v.get("_mtime")) for k, v in docs),
+        "index_size": st.st_size,
+        "index_mtime_ns": st.st_mtime_ns,
+    }
+    _write_text_atomic(header_path(index_path), [json.dumps(header, indent=2)])
+    return header
+
+
+# --- Manifest ---
+# index.manifest.json: sha1 của từng bản ghi như được ghi trong index.json, kèm version lúc tài liệu
+# được thêm/đổi, và version lúc bị xoá → biết "những gì đã đổi kể từ version N" (xem pdf_index_delta.py).
+def manifest_path(index_path):
+    return os.path.splitext(index_path)[0] + ".manifest.json"
+
+
+def content_digest(checksums):
+    """Digest of {rel_path: record sha1}; equal digests mean identical index content."""
+    h = hashlib.sha1()
+    for rel_path, checksum in sorted(checksums.items()):
+        h.update(f"{rel_path}\0{checksum}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _read_manifest_file(index_path):
+    try:
+        with open(manifest_path(index_path), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if isinstance(manifest, dict) else None
+
+
+def read_manifest(index_path):
+    """Return the manifest of ``index_path``, or None if it is missing or out of date."""
+    manifest = _read_manifest_file(index_path)
+    try:
+        st = os.stat(index_path)
+    except OSError:
+        return None
+    if manifest is None or (manifest.get("index_size"), manifest.get("index_mtime_ns")) != (st.st_size, st.st_mtime_ns):
+        return None
+    return manifest
+
+
+def write_manifest(index_path, checksums, version, doc_versions=None):
+    """Rewrite the manifest after ``index_path`` was saved with record ``checksums`` as ``version``.
+
+    Documents whose checksum changed get ``version``; ``doc_versions`` ({rel_path: (created, version)})
+    overrides that, e.g. to keep the versions of the machine a delta package came from.
+    """
+    previous = _read_manifest_file(index_path) or {}
+    old_docs = previous.get("docs") or {}
+    doc_versions = doc_versions or {}
+    docs = {}
+    for rel_path, checksum in checksums.items():
+        old = old_docs.get(rel_path)
+        if rel_path in doc_versions:
+            created, changed = doc_versions[rel_path]
+        elif old is None:
+            created = changed = version
+        else:
+            created, changed = old[0], (old[1] if old[2] == checksum else version)
+        docs[rel_path] = [created, changed, checksum]
+    removed = {k: v for k, v in (previous.get("removed") or {}).items() if k not in docs}
+    removed.update((k, version) for k in old_docs if k not in docs)
+    st = os.stat(index_path)
+    manifest = {
+        "schema": schema_header(),
+        "version": version,
+        "content_digest": content_digest(checksums),
+        "index_size": st.st_size,
+        "index_mtime_ns": st.st_mtime_ns,
+        "docs": docs,          # rel_path → [version lúc thêm, version lúc đổi gần nhất, sha1]
+        "removed": removed,    # rel_path → version lúc bị xoá
+    }
+    _write_text_atomic(manifest_path(index_path), [json.dumps(manifest, ensure_ascii=False)])
+    return manifest
+
+
+# --- Writer ---
+def _iter_record_chunks(record):
+    pages = record.get("pages")
+    if isinstance(pages, list) or pages is None:
+        yield json.dumps(record, ensure_ascii=False)
+        return
+    # pages là iterable (vd. PageSpool) → ghi từng trang, không dựng cả list trong RAM
+    head = {k: v for k, v in record.items() if k != "pages"}
+    yield json.dumps(head, ensure_ascii=False)[:-1] + (", " if head else "") + '"pages": ['
+    for i, page in enumerate(pages):
+        yield (", " if i else "") + json.dumps(page, ensure_ascii=False)
+    yield "]}"
+
+
+def _iter_json_chunks(index_data, checksums=None, offsets=None):
+    """Yield the encoded index; fills ``checksums`` (sha1) and ``offsets`` ((offset, length)) per record."""
+    head = f"{{\n{json.dumps(SCHEMA_KEY)}: {json.dumps(schema_header())}".encode("utf-8")
+    pos = len(head)
+    yield head
+    for key in index_data:
+        if not isinstance(key, str) or key.startswith("_"):
+            continue
+        prefix = f",\n{json.dumps(key, ensure_ascii=False)}: ".encode("utf-8")
+        pos += len(prefix)
+        yield prefix
+        # sha1 của đúng đoạn text bản ghi (một dòng) → pdf_index_delta đối chiếu được mà không parse lại
+        h = hashlib.sha1() if checksums is not None else None
+        start = pos
+        for chunk in _iter_record_chunks(index_data[key]):
+            data = chunk.encode("utf-8")
+            if h is not None:
+                h.update(data)
+            pos += len(data)
+            yield data
+        if h is not None:
+            checksums[key] = h.hexdigest()
+        if offsets is not None:
+            offsets[key] = (start, pos - start)
+    yield b"\n}\n"
+
+
+REPLACE_RETRIES = 20
+
+
+def _replace(src, dst):
+    # Windows: os.replace lỗi khi có người đọc đang mở file đích (vd. app tìm kiếm đang nạp) → chờ rồi thử lại
+    for attempt in range(REPLACE_RETRIES):
+        try:
+            os.replace(src, dst)  # atomic on Windows & POSIX
+            return
+        except PermissionError:
+            if attempt == REPLACE_RETRIES - 1:
+                raise
+            time.sleep(0.25)
+
+
+def _write_text_atomic(path, chunks, check=None):
+    dir_ = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(prefix="index_", suffix=".tmp", dir=dir_)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk if isinstance(chunk, bytes) else chunk.encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        if check is not None:
+            check()  # raise → file cũ giữ nguyên
+        _replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except Exception:
+                pass
+
+
+def save_index(path, index_data, version=None, doc_versions=None, check=None):
+    """Atomically write ``index_data`` as a v2 index, one document per line, and refresh its header and manifest.
+
+    ``check(checksums)`` may raise to abort before the old file is replaced; ``version`` and
+    ``doc_versions`` are passed on to :func:`refresh_header` / :func:`write_manifest`.
+    """
+    previous = _read_header_file(path)  # chỉ cần số version, kể cả khi header đã cũ
+    checksums, offsets = {}, {}
+    _write_text_atomic(path, _iter_json_chunks(index_data, checksums, offsets),
+                       check=(lambda: check(checksums)) if check else None)
+    # Trang đang nằm trên đĩa (file cũ/spool) → trỏ sang vị trí mới trong file vừa ghi
+    stamp = file_stamp(path)
+    for key, (offset, length) in offsets.items():
+        pages = index_data[key].get("pages")
+        if isinstance(pages, (StoredPages, PageSpool)):
+            index_data[key]["pages"] = StoredPages(path, offset, length, len(pages), stamp)
+            if isinstance(pages, PageSpool):
+                pages.discard()
+    header = refresh_header(path, index_data, previous, version=version)
+    write_manifest(path, checksums, header["version"], doc_versions)
+    return header
+
+
+# --- Search ---
+def read_terms_file(path):
+    """Read a term list: one term per line, blank lines and ``#`` comments ignored."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def search_pages(index, keyword):
+    """Yield (DocRecord, page_no, text) for every page containing ``keyword`` (case-insensitive)."""
+    needle = keyword.lower()
+    if not needle:
+        return
+    for doc in index:
+        for page_no, text in doc.iter_pages():
+            if needle in text.lower():
+                yield doc, page_no, text
@@ -0,0 +1,258 @@
+import os, re, argparse
+import numpy as np
+from pdf_index_store import listing_digest, load_index_dict, read_header, read_terms_file
+
+# --- Page-term matrix (CSR) ---
+# Mỗi hàng là một trang (path, page), mỗi cột là một từ trong vocab.
+# Lưu ở index.terms.npz cạnh index.json; indexer cập nhật theo từng tài liệu
+# (và chỉ import module này — tức numpy — khi ma trận được bật).
+
+TOKEN_RE = re.compile(r"\w{2,40}")
+
+
+def terms_path(index_path):
+    return os.path.splitext(index_path)[0] + ".terms.npz"
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class TermMatrix:
+    def __init__(self):
+        self.vocab = []          # term id → term
+        self.term_ids = {}       # term → term id
+        self.docs = []           # doc id → rel_path
+        self.doc_ids = {}        # rel_path → doc id
+        self.doc_mtimes = {}     # rel_path → _mtime (để biết ma trận có khớp index không)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.data = np.zeros(0, dtype=np.int32)
+        self.row_docs = np.zeros(0, dtype=np.int32)
+        self.row_pages = np.zeros(0, dtype=np.int32)
+        self._pending = {}       # rel_path → [(page, ids, counts)], chưa gộp vào CSR
+        self._dropped = set()    # doc id có hàng cũ cần bỏ khi gộp
+
+    # --- Build ---
+    @classmethod
+    def from_index(cls, index_data):
+        m = cls()
+        for rel_path, record in index_data.items():
+            if isinstance(rel_path, str) and not rel_path.startswith("_"):
+                m.update_document(rel_path, record.get("_mtime"), record.get("pages") or [])
+        return m
+
+    def _doc_id(self, rel_path):
+        doc_id = self.doc_ids.get(rel_path)
+        if doc_id is None:
+            doc_id = self.doc_ids[rel_path] = len(self.docs)
+            self.docs.append(rel_path)
+        return doc_id
+
+    def _term_id(self, term):
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            term_id = self.term_ids[term] = len(self.vocab)
+            self.vocab.append(term)
+        return term_id
+
+    def update_document(self, rel_path, mtime, pages):
+        """Replace the rows of ``rel_path`` with term counts of ``pages`` ({"page", "text"} dicts)."""
+        self._dropped.add(self._doc_id(rel_path))
+        rows = []
+        for page in pages:
+            ids = np.fromiter((self._term_id(t) for t in tokenize(page.get("text") or "")), dtype=np.int32)
+            if len(ids):
+                ids, counts = np.unique(ids, return_counts=True)
+                rows.append((int(page.get("page") or 0), ids, counts.astype(np.int32)))
+        self._pending[rel_path] = rows
+        self.doc_mtimes[rel_path] = mtime
+
+    def remove_document(self, rel_path):
+        doc_id = self.doc_ids.get(rel_path)
+        if doc_id is not None:
+            self._dropped.add(doc_id)
+        self._pending.pop(rel_path, None)
+        self.doc_mtimes.pop(rel_path, None)
+
+    def retain(self, rel_paths):
+        keep = set(rel_paths)
+        for rel_path in [p for p in self.doc_mtimes if p not in keep]:
+            self.remove_document(rel_path)
+
+    def digest(self):
+        return listing_digest(self.doc_mtimes.items())
+
+    def merge_pending(self):
+        """Fold documents updated since the last save into the CSR arrays (compact in memory)."""
+        self._merge()
+
+    def _merge(self):
+        if not self._pending and not self._dropped:
+            return
+        lengths = np.diff(self.indptr)
+        keep_rows = ~np.isin(self.row_docs, np.fromiter(self._dropped, dtype=np.int32))
+        keep_nnz = np.repeat(keep_rows, lengths)
+
+        parts_len = [lengths[keep_rows]]
+        parts_idx, parts_data = [self.indices[keep_nnz]], [self.data[keep_nnz]]
+        parts_doc, parts_page = [self.row_docs[keep_rows]], [self.row_pages[keep_rows]]
+        for rel_path, rows in self._pending.items():
+            doc_id = self.doc_ids[rel_path]
+            for page, ids, counts in rows:
+                parts_len.append(np.array([len(ids)], dtype=np.int64))
+                parts_idx.append(ids)
+                parts_data.append(counts)
+                parts_doc.append(np.array([doc_id], dtype=np.int32))
+                parts_page.append(np.array([page], dtype=np.int32))
+
+        self.indptr = np.concatenate(([0], np.cumsum(np.concatenate(parts_len)))).astype(np.int64)
+        self.indices = np.concatenate(parts_idx).astype(np.int32)
+        self.data = np.concatenate(parts_data).astype(np.int32)
+        self.row_docs = np.concatenate(parts_doc).astype(np.int32)
+        self.row_pages = np.concatenate(parts_page).astype(np.int32)
+        self._pending.clear()
+        self._dropped.clear()
+
+    # --- Persistence ---
+    def save(self, path):
+        self._merge()
+        tmp_path = path + ".tmp.npz"
+        mtime_docs = list(self.doc_mtimes)
+        np.savez_compressed(
+            tmp_path,
+            indptr=self.indptr, indices=self.indices, data=self.data,
+            row_docs=self.row_docs, row_pages=self.row_pages,
+            vocab=np.array(self.vocab, dtype=str), docs=np.array(self.docs, dtype=str),
+            mtime_docs=np.array(mtime_docs, dtype=str),
+            mtimes=np.array([np.nan if self.doc_mtimes[p] is None else self.doc_mtimes[p] for p in mtime_docs],
+                            dtype=np.float64),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        m = cls()
+        with np.load(path) as z:
+            m.indptr, m.indices, m.data = z["indptr"], z["indices"], z["data"]
+            m.row_docs, m.row_pages = z["row_docs"], z["row_pages"]
+            m.vocab = z["vocab"].tolist()
+            m.docs = z["docs"].tolist()
+            m.doc_mtimes = {p: (None if t != t else t) for p, t in zip(z["mtime_docs"].tolist(), z["mtimes"].tolist())}
+        m.term_ids = {t: i for i, t in enumerate(m.vocab)}
+        m.doc_ids = {p: i for i, p in enumerate(m.docs)}
+        return m
+
+    def to_scipy(self):
+        """Return the matrix as ``scipy.sparse.csr_matrix`` (requires scipy)."""
+        from scipy.sparse import csr_matrix
+        self._merge()
+        return csr_matrix((self.data, self.indices, self.indptr), shape=(len(self.row_docs), len(self.vocab)))
+
+    # --- Queries (vectorized) ---
+    def _row_ids(self):
+        return np.repeat(np.arange(len(self.row_docs), dtype=np.int64), np.diff(self.indptr))
+
+    def _resolve(self, terms):
+        """Split ``terms`` into single-token term ids and multi-token id tuples (unknown terms dropped)."""
+        single, multi = [], []
+        for term in terms:
+            tokens = tokenize(term)
+            if not tokens or any(t not in self.term_ids for t in tokens):
+                continue
+            ids = tuple(self.term_ids[t] for t in tokens)
+            if len(ids) == 1:
+                single.append(ids[0])
+            else:
+                multi.append(ids)
+        return np.array(single, dtype=np.int32), multi
+
+    def page_counts(self, terms):
+        """Per-page total count of ``terms`` as an array aligned with the rows."""
+        self._merge()
+        single, multi = self._resolve(terms)
+        rows = self._row_ids()
+        counts = np.bincount(rows, weights=np.where(np.isin(self.indices, single), self.data, 0),
+                             minlength=len(self.row_docs))
+        # Cụm nhiều từ: xấp xỉ bằng "trang chứa đủ mọi từ", đếm theo từ hiếm nhất
+        for ids in multi:
+            per_token = [np.bincount(rows, weights=np.where(self.indices == i, self.data, 0),
+                                     minlength=len(self.row_docs)) for i in ids]
+            counts += np.minimum.reduce(per_token)
+        return counts
+
+    def doc_scores(self, terms):
+        """Total count of ``terms`` per document id."""
+        return np.bincount(self.row_docs, weights=self.page_counts(terms), minlength=len(self.docs))
+
+    def top_documents(self, terms, n=20):
+        scores = self.doc_scores(terms)
+        order = np.argsort(-scores, kind="stable")[:n]
+        return [(self.docs[i], int(scores[i])) for i in order if scores[i] > 0]
+
+    def pages_containing_any(self, terms):
+        counts = self.page_counts(terms)
+        hits = np.nonzero(counts)[0]
+        return [(self.docs[self.row_docs[r]], int(self.row_pages[r]), int(counts[r])) for r in hits]
+
+    def term_frequencies(self, n=50):
+        """Top ``n`` terms as (term, total count, number of pages)."""
+        self._merge()
+        totals = np.bincount(self.indices, weights=self.data, minlength=len(self.vocab))
+        page_freq = np.bincount(self.indices, minlength=len(self.vocab))
+        order = np.argsort(-totals, kind="stable")[:n]
+        return [(self.vocab[i], int(totals[i]), int(page_freq[i])) for i in order if totals[i] > 0]
+
+
+def load_if_current(path, digest):
+    """Load the matrix at ``path`` if it covers exactly the (path, mtime) set with ``digest``."""
+    try:
+        m = TermMatrix.load(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    return m if m.digest() == digest else None
+
+
+def open_term_matrix(path, index_data):
+    """Load the matrix at ``path`` if it matches ``index_data``, otherwise rebuild it from the index."""
+    digest = listing_digest((k, v.get("_mtime")) for k, v in index_data.items() if not k.startswith("_"))
+    return load_if_current(path, digest) or TermMatrix.from_index(index_data)
+
+
+def open_for_index(index_path):
+    """Return an up-to-date matrix for ``index_path``, rebuilding and saving it only when stale."""
+    path = terms_path(index_path)
+    header = read_header(index_path)
+    matrix = load_if_current(path, header["digest"]) if header else None
+    if matrix is None:
+        matrix = TermMatrix.from_index(load_index_dict(index_path))
+        matrix.save(path)
+    return matrix
+
+
+# --- Main ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Term statistics over a PDF index (index.terms.npz).")
+    parser.add_argument('--path', type=str, default="../database/pdf-test",
+                        help='Folder containing index.json (default: ../database/pdf-test)')
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_top = sub.add_parser("top", help="documents mentioning the given terms most")
+    p_top.add_argument("terms", nargs="+")
+    p_top.add_argument("-n", type=int, default=20)
+    p_freq = sub.add_parser("freq", help="most frequent terms in the corpus")
+    p_freq.add_argument("-n", type=int, default=50)
+    p_any = sub.add_parser("any", help="pages containing any term listed in a file (one per line)")
+    p_any.add_argument("terms_file")
+    args = parser.parse_args()
+
+    matrix = open_for_index(os.path.join(os.path.abspath(args.path), "index.json"))
+
+    if args.command == "top":
+        for rel_path, score in matrix.top_documents(args.terms, args.n):
+            print(f"{score}\t{rel_path}")
+    elif args.command == "freq":
+        for term, total, pages in matrix.term_frequencies(args.n):
+            print(f"{total}\t{pages}\t{term}")
+    else:
+        for rel_path, page, count in matrix.pages_containing_any(read_terms_file(args.terms_file)):
+            print(f"{rel_path}\t{page}\t{count}")
@@ -0,0 +1,263 @@
+import os, sys, zlib, struct, hashlib, argparse, tempfile
+from array import array
+from pdf_index_lock import IndexLock
+from pdf_index_store import IndexFormatError, iter_documents, load_index_dict, save_index
+
+# --- Word cache (layout) ---
+# Lưu kết quả trích xuất mức từ của pdfplumber (từ + bounding box, theo trang) ở dạng nhị phân gọn:
+# index.words/<sha1(rel_path)>.words. Các bước làm sạch text / tách từ có thể chạy lại từ cache
+# mà không cần parse lại PDF, và tính năng highlight có thể dùng toạ độ trên trang.
+#
+# File: MAGIC + zlib stream gồm: u16 độ dài + rel_path (utf-8), rồi mỗi trang:
+#   8 byte fingerprint, u32 page_no, f32 width, f32 height, u32 số từ W, u32 số byte L,
+#   L byte các từ (utf-8, nối bằng "\n"), 4·W float32 (x0, top, x1, bottom) little-endian.
+
+MAGIC = b"PWC1"
+_PAGE = struct.Struct("<8sIffII")
+_PATH = struct.Struct("<H")
+LINE_TOLERANCE = 3.0  # chênh lệch "top" (pt) tối đa để hai từ được coi là cùng dòng
+
+
+def words_dir(index_path):
+    return os.path.splitext(index_path)[0] + ".words"
+
+
+def words_path(index_path, rel_path):
+    key = hashlib.sha1(rel_path.encode("utf-8")).hexdigest()
+    return os.path.join(words_dir(index_path), key + ".words")
+
+
+class PageWords:
+    __slots__ = ("fp", "page_no", "width", "height", "words", "boxes")
+
+    def __init__(self, fp, page_no, width, height, words, boxes):
+        self.fp = fp              # page fingerprint (16 hex), như trong "page_fps" của index
+        self.page_no = page_no
+        self.width = width
+        self.height = height
+        self.words = words        # tuple[str]
+        self.boxes = boxes        # array('f'): x0, top, x1, bottom cho từng từ
+
+    @classmethod
+    def from_page(cls, page, page_no, fp):
+        """Extract words with their bounding boxes from a pdfplumber page."""
+        words = page.extract_words()
+        boxes = array("f")
+        for w in words:
+            boxes.extend((w["x0"], w["top"], w["x1"], w["bottom"]))
+        return cls(fp, page_no, float(page.width), float(page.height), tuple(w["text"] for w in words), boxes)
+
+    def __len__(self):
+        return len(self.words)
+
+    def box(self, i):
+        return tuple(self.boxes[4 * i:4 * i + 4])
+
+    def lines(self, tolerance=LINE_TOLERANCE):
+        """Group words into lines (top to bottom, left to right); returns [[word index, ...], ...]."""
+        order = sorted(range(len(self.words)), key=lambda i: (self.boxes[4 * i + 1], self.boxes[4 * i]))
+        lines, current, top = [], [], None
+        for i in order:
+            word_top = self.boxes[4 * i + 1]
+            if current and word_top - top > tolerance:
+                lines.append(current)
+                current = []
+            if not current:
+                top = word_top
+            current.append(i)
+        if current:
+            lines.append(current)
+        return [sorted(line, key=lambda i: self.boxes[4 * i]) for line in lines]
+
+    def text(self, tolerance=LINE_TOLERANCE):
+        """Rebuild plain page text from the cached words (one line per text line)."""
+        return "\n".join(" ".join(self.words[i] for i in line) for line in self.lines(tolerance))
+
+    def find(self, keyword):
+        """Bounding boxes of words containing ``keyword`` (case-insensitive), e.g. for highlighting."""
+        needle = keyword.lower()
+        return [self.box(i) for i, w in enumerate(self.words) if needle and needle in w.lower()]
+
+
+# --- Binary format ---
+def _pack_page(pw):
+    data = "\n".join(pw.words).encode("utf-8")
+    boxes = array("f", pw.boxes)
+    if sys.byteorder != "little":
+        boxes.byteswap()
+    return _PAGE.pack(bytes.fromhex(pw.fp), pw.page_no, pw.width, pw.height, len(pw.words), len(data)) \
+        + data + boxes.tobytes()
+
+
+class WordCacheWriter:
+    """Stream the pages of one document into its cache file; replaced atomically on close()."""
+
+    __slots__ = ("path", "count", "_f", "_z", "_tmp")
+
+    def __init__(self, path, rel_path):
+        self.path = path
+        self.count = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, self._tmp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+        self._f = os.fdopen(fd, "wb")
+        self._f.write(MAGIC)
+        self._z = zlib.compressobj(6)
+        encoded = rel_path.encode("utf-8")
+        self._f.write(self._z.compress(_PATH.pack(len(encoded)) + encoded))
+
+    def add(self, page_words):
+        self._f.write(self._z.compress(_pack_page(page_words)))
+        self.count += 1
+
+    def close(self):
+        self._f.write(self._z.flush())
+        self._f.close()
+        os.replace(self._tmp, self.path)
+
+    def discard(self):
+        self._f.close()
+        if os.path.exists(self._tmp):
+            os.remove(self._tmp)
+
+
+def read_words(path):
+    """Return (rel_path, [PageWords]) from a cache file."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise IndexFormatError(f"{path} is not a word cache file")
+        try:
+            buf = zlib.decompress(f.read())
+        except zlib.error as e:
+            raise IndexFormatError(f"{path}: {e}")
+    try:
+        (n,) = _PATH.unpack_from(buf, 0)
+        pos = _PATH.size + n
+        rel_path = buf[_PATH.size:pos].decode("utf-8")
+        pages = []
+        while pos < len(buf):
+            fp, page_no, width, height, count, size = _PAGE.unpack_from(buf, pos)
+            pos += _PAGE.size
+            text = buf[pos:pos + size].decode("utf-8")
+            pos += size
+            boxes = array("f")
+            boxes.frombytes(buf[pos:pos + 16 * count])
+            pos += 16 * count
+            if sys.byteorder != "little":
+                boxes.byteswap()
+            words = tuple(text.split("\n")) if count else ()
+            if len(words) != count or len(boxes) != 4 * count:
+                raise IndexFormatError(f"{path}: damaged page {page_no}")
+            pages.append(PageWords(fp.hex(), page_no, width, height, words, boxes))
+    except (struct.error, UnicodeDecodeError) as e:
+        raise IndexFormatError(f"{path}: {e}")
+    return rel_path, pages
+
+
+def load_document(index_path, rel_path):
+    """Cached pages of ``rel_path`` as {fingerprint: PageWords} ({} if not cached or unreadable)."""
+    try:
+        cached_path, pages = read_words(words_path(index_path, rel_path))
+    except (OSError, IndexFormatError):
+        return {}
+    return {pw.fp: pw for pw in pages} if cached_path == rel_path else {}
+
+
+def prune(index_path, rel_paths):
+    """Delete cache files of documents not in ``rel_paths``; returns how many were removed."""
+    folder = words_dir(index_path)
+    if not os.path.isdir(folder):
+        return 0
+    keep = {os.path.basename(words_path(index_path, p)) for p in rel_paths}
+    removed = 0
+    for name in os.listdir(folder):
+        if name.endswith(".words") and name not in keep:
+            os.remove(os.path.join(folder, name))
+            removed += 1
+    return removed
+
+
+# --- Replay ---
+def _default_cleanup(text):
+    return text.strip()
+
+
+def replay(index_path, cleanup=_default_cleanup, log=print):
+    """Rebuild page texts of ``index_path`` from the word cache, applying ``cleanup`` to each page.
+
+    Only documents whose cached pages match their ``page_fps`` are rewritten; returns
+    (documents rewritten, documents skipped).
+    """
+    with IndexLock(index_path) as lock:
+        return _replay(index_path, cleanup, log, lock)
+
+
+def _replay(index_path, cleanup, log, lock):
+    index_data = load_index_dict(index_path)
+    rewritten, skipped = [], 0
+    for rel_path, record in index_data.items():
+        fps = record.get("page_fps") or []
+        cached = load_document(index_path, rel_path)
+        if not fps or any(fp not in cached for fp in fps):
+            skipped += 1
+            log(f"⏭️ No complete word cache: {rel_path}")
+            continue
+        pages = []
+        for page_no, fp in enumerate(fps, start=1):
+            text = cleanup(cached[fp].text())
+            if text:
+                pages.append({"page": page_no, "text": text})
+        record["pages"] = pages
+        rewritten.append(rel_path)
+    save_index(index_path, index_data, check=lambda _: lock.verify())
+    _refresh_derived(index_path, index_data, rewritten, log)
+    return len(rewritten), skipped
+
+
+def _refresh_derived(index_path, index_data, rel_paths, log):
+    """Update structures built from page text after ``rel_paths`` were rewritten (still under the lock)."""
+    # _mtime không đổi nên digest (path, mtime) của terms/fields vẫn "khớp" → phải cập nhật ngay tại đây
+    base = os.path.splitext(index_path)[0]
+    if os.path.exists(base + ".terms.npz"):
+        from pdf_index_terms import TermMatrix
+        TermMatrix.from_index(index_data).save(base + ".terms.npz")
+        log("🔁 Rebuilt index.terms.npz")
+    if os.path.exists(base + ".fields.jsonl"):
+        from pdf_index_fields import open_field_index
+        fields = open_field_index(base + ".fields.jsonl")
+        for rel_path in rel_paths:
+            doc = fields.docs.get(rel_path)
+            record = index_data[rel_path]
+            fields.update_document(rel_path, record.get("_mtime"), record["pages"], doc["tables"] if doc else ())
+        fields.save(base + ".fields.jsonl")
+        log(f"🔁 Re-split sections of {len(rel_paths)} document(s) in index.fields.jsonl")
+    if os.path.exists(base + ".embeddings.npz"):
+        from pdf_index_semantic import prune as prune_embeddings
+        dropped = prune_embeddings(index_path)
+        log(f"🔁 Dropped {dropped} outdated vector(s); run `pdf_index_semantic.py build` to embed the new text")
+
+
+# --- Main ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or replay the word-level extraction cache (index.words/).")
+    parser.add_argument('--path', type=str, default="../database/pdf-test",
+                        help='Folder containing index.json (default: ../database/pdf-test)')
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("replay", help="rebuild index.json page texts from the cache (no PDF parsing)")
+    p_find = sub.add_parser("find", help="print bounding boxes of a keyword on cached pages")
+    p_find.add_argument("keyword")
+    p_find.add_argument("--doc", type=str, default=None, help="only this document (path relative to --path)")
+    args = parser.parse_args()
+
+    index_json = os.path.join(os.path.abspath(args.path), "index.json")
+    if args.command == "replay":
+        rewritten, skipped = replay(index_json)
+        print(f"✅ Done. Rewritten: {rewritten} | Skipped (no complete cache): {skipped}")
+    else:
+        for rel_path, record in iter_documents(index_json):
+            if args.doc and rel_path != os.path.normpath(args.doc):
+                continue
+            cached = load_document(index_json, rel_path)
+            for page_no, fp in enumerate(record.get("page_fps") or [], start=1):
+                pw = cached.get(fp)
+                for x0, top, x1, bottom in (pw.find(args.keyword) if pw else []):
+                    print(f"{rel_path}\tp.{page_no}\t{x0:.1f},{top:.1f},{x1:.1f},{bottom:.1f}")
@@ -0,0 +1,5 @@
+import os, sys
+
+# Các module nằm ở thư mục gốc repo (chạy trực tiếp bằng python <file>.py), không phải package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
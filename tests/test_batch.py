@@ -0,0 +1,27 @@
+import sys
+import pytest
+from pdf_index_batch import TermMatcher
+
+TERMS = ["lactose", "lactose monohydrate", "sodium", "sodium chloride"]
+TEXT = "Contains Lactose monohydrate and sodium chloride. Lactose-free: no."
+
+
+@pytest.fixture
+def no_ahocorasick(monkeypatch):
+    monkeypatch.setitem(sys.modules, "ahocorasick", None)  # import → ImportError
+
+
+def test_regex_fallback_counts_terms_inside_longer_terms(no_ahocorasick):
+    matcher = TermMatcher(TERMS)
+    assert matcher._automaton is None
+    assert matcher.count(TEXT) == {"lactose": 2, "lactose monohydrate": 1, "sodium": 1, "sodium chloride": 1}
+
+
+def test_regex_fallback_matches_automaton():
+    pytest.importorskip("ahocorasick")
+    expected = TermMatcher(TERMS).count(TEXT)
+    sys.modules["ahocorasick"], saved = None, sys.modules["ahocorasick"]
+    try:
+        assert TermMatcher(TERMS).count(TEXT) == expected
+    finally:
+        sys.modules["ahocorasick"] = saved
@@ -0,0 +1,45 @@
+import os, sys, time, subprocess
+import pytest
+from pdf_index_compact import TMP_MIN_AGE, CompactError, compact_index, spool_lock_target
+from pdf_index_lock import IndexLock
+from pdf_index_store import save_index
+from test_startup import ROOT
+
+
+def _old_spool(folder, name):
+    spool = folder / name
+    spool.mkdir()
+    (spool / "page.jsonl").write_text('{"page": 1, "text": "x"}\n', encoding="utf-8")
+    old = time.time() - 2 * TMP_MIN_AGE  # indexer đang trích xuất một tài liệu lớn → thư mục không đổi mtime
+    os.utime(spool, (old, old))
+    return spool
+
+
+def test_compact_keeps_spools_of_running_indexers(tmp_path):
+    index_json = str(tmp_path / "index.json")
+    save_index(index_json, {"a.pdf": {"_mtime": 1.0, "pages": [{"page": 1, "text": "x"}]}})
+    live, abandoned = _old_spool(tmp_path, ".index_spool_live"), _old_spool(tmp_path, ".index_spool_dead")
+    lock = IndexLock(spool_lock_target(str(live))).acquire()
+    try:
+        os.utime(live, (time.time() - 2 * TMP_MIN_AGE,) * 2)
+        compact_index(index_json, log=lambda *_: None)
+        assert (live / "page.jsonl").exists()
+        assert not abandoned.exists()
+    finally:
+        lock.release()
+
+
+def test_missing_or_corrupt_index_is_reported(tmp_path):
+    index_json = str(tmp_path / "index.json")
+    with pytest.raises(CompactError, match="not found"):
+        compact_index(index_json, log=lambda *_: None)
+    assert not os.path.exists(tmp_path / "index.lock")
+    with open(index_json, "w", encoding="utf-8") as f:
+        f.write('{"a.pdf": {"_mtime": 1.0, "pages": [')
+    with pytest.raises(CompactError, match="cannot be read"):
+        compact_index(index_json, log=lambda *_: None)
+
+    result = subprocess.run([sys.executable, "index_pdf_1cpu_path_v2.py", "compact", "--path", str(tmp_path)],
+                            cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 1
+    assert "❌" in result.stderr and "Traceback" not in result.stderr
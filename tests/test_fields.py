@@ -0,0 +1,27 @@
+from pdf_index_fields import FieldIndex
+
+PAGES = [{"page": 1, "text": "1. What Promixin is\nPromixin treats pain.\n2. Before you take Promixin\n"
+                             "Do not take Promixin\nif you are allergic to aspirin or ibuprofen."}]
+
+
+def _index():
+    fields = FieldIndex()
+    fields.update_document("a.pdf", 1.0, PAGES, [(1, "fp", [["Dose", "Aspirin 100 mg"]])])
+    fields.update_document("b.pdf", 1.0, [{"page": 1, "text": "2. Before you take Other\nDo not take Other\nif you have allergies."}])
+    return fields
+
+
+def test_substring_matches_like_whole_page_search():
+    fields = _index()
+    assert [p for p, _, _ in fields.search("contraindications", "aspir")] == ["a.pdf"]
+    assert [p for p, _, _ in fields.search("contraindications", "ALLERGI")] == ["a.pdf", "b.pdf"]
+    assert [p for p, _, _ in fields.search("contraindications", "aspirin or ibu")] == ["a.pdf"]
+    assert fields.search("contraindications", "aspirin and") == []
+    assert [p for p, _, _ in fields.search("tables", "100 mg")] == ["a.pdf"]
+
+
+def test_only_candidate_entries_are_read():
+    fields = _index()
+    fields.search("contraindications", "aspirin")  # dựng postings
+    fields.docs["b.pdf"]["sections"] = None  # đọc tới tài liệu không chứa từ khoá → TypeError
+    assert [p for p, _, _ in fields.search("contraindications", "aspirin")] == ["a.pdf"]
@@ -0,0 +1,25 @@
+import os, time
+import pytest
+from pdf_index_lock import IndexLock, LockLost, LockTimeout, lock_path, read_lock
+
+
+def test_heartbeat_keeps_a_long_holder(tmp_path):
+    index_json = str(tmp_path / "index.json")
+    with IndexLock(index_json, lease=0.6) as lock:
+        time.sleep(1.5)  # lâu hơn lease → không có heartbeat thì người khác đã phá được lock
+        with pytest.raises(LockTimeout):
+            IndexLock(index_json, lease=0.6, timeout=0.3).acquire()
+        assert read_lock(lock_path(index_json))["expires"] > time.time()
+        lock.verify()
+    assert not os.path.exists(lock_path(index_json))
+
+
+def test_lost_lease_is_reported(tmp_path):
+    index_json = str(tmp_path / "index.json")
+    with pytest.raises(LockLost):
+        with IndexLock(index_json) as lock:
+            os.remove(lock_path(index_json))
+            other = IndexLock(index_json).acquire()  # người khác lấy lock sau khi lease bị phá
+            with pytest.raises(LockLost):
+                lock.verify()
+    assert other.release()
@@ -0,0 +1,43 @@
+import os
+import pdf_index_log
+from pdf_index_log import IndexLogger
+
+
+def _lines(path, backups):
+    lines = []
+    for p in [path] + [f"{path}.{i}" for i in range(1, backups + 1)]:
+        if os.path.exists(p):
+            with open(p, "r", encoding="utf-8") as f:
+                lines += f.read().splitlines()
+    return lines
+
+
+def test_failed_rotation_still_appends(tmp_path, monkeypatch):
+    path = str(tmp_path / "index_failed.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("x" * 200 + "\n")
+
+    def sharing_violation(src, dst):
+        raise PermissionError(32, "The process cannot access the file because it is being used by another process")
+
+    monkeypatch.setattr(pdf_index_log.os, "replace", sharing_violation)
+    logger = IndexLogger(path, max_bytes=100, flush_interval=0.05)
+    for i in range(5):
+        logger.log(f"record {i}")
+    logger.close()
+    monkeypatch.undo()
+    assert [line.split("] ")[1] for line in _lines(path, 0)[1:]] == [f"record {i}" for i in range(5)]
+    assert not os.path.exists(path + ".rotating")
+
+
+def test_writers_sharing_a_file_lose_no_records(tmp_path, writers=2):
+    path = str(tmp_path / "index.log")
+    loggers = [IndexLogger(path, max_bytes=2000, backup_count=100, batch_size=7, flush_interval=0.01)
+               for _ in range(writers)]
+    for i in range(300):
+        for n, logger in enumerate(loggers):
+            logger.log(f"writer {n} record {i}")
+    for logger in loggers:
+        logger.close()
+    records = [line.split("] ")[1] for line in _lines(path, 100)]
+    assert sorted(records) == sorted(f"writer {n} record {i}" for i in range(300) for n in range(writers))
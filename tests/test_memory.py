@@ -0,0 +1,75 @@
+import os, sys, subprocess
+import pytest
+from pdf_index_store import load_index_meta, read_header, save_index
+from test_startup import ROOT, blank_pdf
+
+pytest.importorskip("pdfplumber")
+pytestmark = pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="peak RSS is read from /proc (Linux)")
+
+DOCS, PAGES = 1000, 100  # 100k trang, ~40 MB index.json
+CEILING_MB = 64
+TEXT = ("Each tablet contains 500 mg paracetamol. Do not take more than the recommended dose. " * 4).strip()
+
+# Chạy indexer trong tiến trình con rồi in peak RSS (VmHWM, MB) của chính tiến trình đó.
+# Không dùng ru_maxrss: nó giữ cả RSS của tiến trình cha lúc fork (pytest vừa dựng corpus lớn).
+RUNNER = ("import os, sys, runpy; sys.path.insert(0, os.getcwd()); "
+          "sys.argv = ['index_pdf_1cpu_path_v2.py'] + sys.argv[1:]\n"
+          "try:\n    runpy.run_path('index_pdf_1cpu_path_v2.py', run_name='__main__')\n"
+          "finally:\n    hwm = [l for l in open('/proc/self/status') if l.startswith('VmHWM:')][0]\n"
+          "    print('PEAK_MB', int(hwm.split()[1]) // 1024)")
+
+
+def synthetic_corpus(root):
+    """index.json with DOCS × PAGES pages for placeholder files (all up to date) plus one new blank PDF."""
+    index_data = {}
+    for d in range(DOCS):
+        rel_path = f"doc{d:04d}.pdf"
+        open(os.path.join(root, rel_path), "wb").close()
+        index_data[rel_path] = {"_mtime": os.path.getmtime(os.path.join(root, rel_path)), "page_fps": [],
+                                "pages": [{"page": p, "text": f"{TEXT} {rel_path} p.{p}"} for p in range(1, PAGES + 1)]}
+    save_index(os.path.join(root, "index.json"), index_data)
+    blank_pdf(os.path.join(root, "new.pdf"))  # → lần chạy phải nạp index và ghi lại toàn bộ
+
+
+def run_indexer(*args):
+    result = subprocess.run([sys.executable, "-c", RUNNER, *args], cwd=ROOT, capture_output=True, text=True, timeout=600)
+    assert result.returncode == 0, result.stderr
+    peak = [line for line in result.stdout.splitlines() if line.startswith("PEAK_MB")]
+    return int(peak[-1].split()[1]), result.stdout
+
+
+def test_peak_rss_stays_under_max_memory(tmp_path):
+    synthetic_corpus(tmp_path)
+    peak, out = run_indexer("--path", str(tmp_path), "--max-memory-mb", str(CEILING_MB))
+    assert "Indexed: 1 | Skipped: 1000" in out
+    assert peak < CEILING_MB
+
+    index_json = str(tmp_path / "index.json")
+    index_data = load_index_meta(index_json)
+    assert sum(len(r["pages"]) for r in index_data.values()) == DOCS * PAGES
+    assert read_header(index_json)["documents"] == DOCS + 1
+
+
+def test_corpus_exceeds_ceiling_without_low_memory_mode(tmp_path):
+    # Đảm bảo test trên có ý nghĩa: nạp đầy đủ cùng corpus vượt trần
+    synthetic_corpus(tmp_path)
+    peak, _ = run_indexer("--path", str(tmp_path))
+    assert peak > CEILING_MB
+
+
+def test_stops_starting_files_above_ceiling(tmp_path):
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        blank_pdf(tmp_path / name)
+    _, out = run_indexer("--path", str(tmp_path), "--max-memory-mb", "1")
+    assert "Indexed: 1 | Skipped: 0 | Updated: 0 | Pruned: 0 | Deferred: 2" in out
+
+
+def test_max_memory_without_a_memory_reader_fails_fast(tmp_path):
+    # Giả lập Windows chưa cài psutil: không có psutil, không có os.sysconf để đọc /proc
+    runner = ("import os, sys, runpy; sys.path.insert(0, os.getcwd()); sys.modules['psutil'] = None; "
+              "del os.sysconf; sys.argv = ['index_pdf_1cpu_path_v2.py'] + sys.argv[1:]; "
+              "runpy.run_path('index_pdf_1cpu_path_v2.py', run_name='__main__')")
+    result = subprocess.run([sys.executable, "-c", runner, "--path", str(tmp_path), "--max-memory-mb", "512"],
+                            cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 2
+    assert "--max-memory-mb needs psutil" in result.stderr
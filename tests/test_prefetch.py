@@ -0,0 +1,28 @@
+import os, time
+from pdf_index_prefetch import Prefetcher
+
+
+def _run(folder, cache_dir, names, cap):
+    for _, source in Prefetcher(str(folder), names, workers=1, cache_dir=str(cache_dir), cache_max_bytes=cap):
+        source.read()
+    time.sleep(0.01)  # mtime của .json là thời điểm dùng gần nhất
+
+
+def _cached(cache_dir):
+    return sorted(os.path.getsize(cache_dir / n) for n in os.listdir(cache_dir) if n.endswith(".pdf"))
+
+
+def test_cache_dir_evicts_least_recently_used(tmp_path):
+    folder, cache_dir = tmp_path / "pdfs", tmp_path / "cache"
+    folder.mkdir()
+    for name, size in (("a.pdf", 1000), ("b.pdf", 1001), ("c.pdf", 1002)):
+        (folder / name).write_bytes(b"x" * size)
+
+    _run(folder, cache_dir, ["a.pdf", "b.pdf"], cap=2500)
+    _run(folder, cache_dir, ["a.pdf"], cap=2500)  # a vừa được dùng → b lâu nhất
+    _run(folder, cache_dir, ["c.pdf"], cap=2500)
+    assert _cached(cache_dir) == [1000, 1002]
+    assert len(os.listdir(cache_dir)) == 4  # .json đi cùng bản sao đã bị xoá
+
+    _run(folder, cache_dir, ["b.pdf"], cap=None)  # không giới hạn → giữ hết
+    assert _cached(cache_dir) == [1000, 1001, 1002]
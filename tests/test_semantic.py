@@ -0,0 +1,43 @@
+import pytest
+from pdf_index_store import load_index, save_index
+
+np = pytest.importorskip("numpy")
+from pdf_index_semantic import (DEFAULT_MODEL, SemanticIndex, _store, _write_cache, chunk_hash, embeddings_path,
+                                iter_chunks, prune)
+
+
+class Encoder:
+    """Model stand-in: every text maps to the same unit vector, so only the keyword score ranks."""
+
+    def encode(self, texts, normalize_embeddings=True, convert_to_numpy=True):
+        return np.ones((len(texts), 2), dtype=np.float32) / np.sqrt(2)
+
+
+def test_keyword_overlap_uses_postings(tmp_path):
+    index_json = str(tmp_path / "index.json")
+    texts = {"a.pdf": "aspirin and ibuprofen", "b.pdf": "paracetamol only", "c.pdf": "aspirin dose"}
+    save_index(index_json, {p: {"_mtime": 1.0, "pages": [{"page": 1, "text": t}]} for p, t in texts.items()})
+    hashes = [chunk_hash(DEFAULT_MODEL, t) for t in texts.values()]
+    _write_cache(embeddings_path(index_json), DEFAULT_MODEL, hashes, Encoder().encode(hashes))
+
+    index = SemanticIndex(index_json, model=Encoder())
+    assert index.postings["aspirin"] == [0, 2]
+    results = index.search("aspirin ibuprofen", k=3, alpha=0.5)
+    assert [r[1] for r in results] == ["a.pdf", "c.pdf", "b.pdf"]
+    assert results[0][0] == pytest.approx(0.5 + 0.5 * 1.0)
+    assert results[1][0] == pytest.approx(0.5 + 0.5 * 0.5)
+
+
+def test_duplicate_chunks_keep_their_own_rows(tmp_path):
+    index_json = str(tmp_path / "index.json")
+    leaflet = [{"page": 1, "text": "Do not take if allergic to aspirin"}, {"page": 2, "text": "Store below 25C"}]
+    save_index(index_json, {f"{d}/{n}.pdf": {"_mtime": 1.0, "pages": leaflet} for d in "ab" for n in range(1, 5)})
+    chunks = list(iter_chunks(load_index(index_json)))
+    _store(index_json, DEFAULT_MODEL, chunks, {chunk_hash(DEFAULT_MODEL, c[2]): v
+                                               for c, v in zip(chunks, Encoder().encode(chunks))})
+
+    index = SemanticIndex(index_json, model=Encoder())
+    assert index.chunks == chunks
+    results = index.search("aspirin allergy", k=8, alpha=0.5)
+    assert sorted((r[1], r[2]) for r in results) == [(f"{d}/{n}.pdf", 1) for d in "ab" for n in range(1, 5)]
+    assert prune(index_json) == 0
@@ -0,0 +1,58 @@
+import os, sys, json, subprocess
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("pdfplumber", "tqdm", "PIL")
+IMPORT_BUDGET_S = 1.0  # rộng cho máy CI chậm; import thật sự chỉ vài chục ms
+
+MODULES = ("index_pdf_1cpu_path_v2", "pdf_index_store", "pdf_index_fields", "pdf_index_querylog", "pdf_index_batch")
+
+
+def blank_pdf(path):
+    """Write a valid one-page PDF without any text (like a scan without OCR)."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+               b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] >>"]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for n, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % n + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(bytes(out))
+
+
+def _run(*args):
+    return subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True, text=True, timeout=300)
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_import_is_light_and_fast(module):
+    code = (f"import sys, time, json; t = time.perf_counter(); import {module}; "
+            f"print(json.dumps([time.perf_counter() - t, [m for m in {HEAVY!r} if m in sys.modules]]))")
+    result = _run("-c", code)
+    assert result.returncode == 0, result.stderr
+    elapsed, heavy = json.loads(result.stdout.strip().splitlines()[-1])
+    assert heavy == []
+    assert elapsed < IMPORT_BUDGET_S
+
+
+def test_noop_run_after_blank_and_broken_pdfs(tmp_path):
+    pytest.importorskip("pdfplumber")
+    blank_pdf(tmp_path / "scan.pdf")
+    (tmp_path / "broken.pdf").write_bytes(b"not a pdf")
+    first = _run("index_pdf_1cpu_path_v2.py", "--path", str(tmp_path))
+    assert first.returncode == 0, first.stderr
+    assert "Indexed: 2" in first.stdout
+
+    second = _run("index_pdf_1cpu_path_v2.py", "--path", str(tmp_path))
+    assert "Indexed: 0 | Skipped: 2" in second.stdout
+    with open(tmp_path / "index.log.txt", encoding="utf-8") as f:
+        assert "Nothing changed" in f.read().splitlines()[-1]
+
+    retry = _run("index_pdf_1cpu_path_v2.py", "--path", str(tmp_path), "--retry-failed")
+    assert "Indexed: 1 | Skipped: 1" in retry.stdout
@@ -0,0 +1,28 @@
+import json, sys, warnings
+import pytest
+from pdf_index_store import iter_documents
+
+LAYOUTS = {
+    "v2": {"a.pdf": {"_mtime": 1.0, "pages": [{"page": 1, "text": "Thuốc giảm đau"}]}},
+    "ocr": [{"filename": "scan_page_2.png", "text": "Chống chỉ định"}],
+}
+
+
+@pytest.fixture(params=["ijson", "json"])
+def parser(request, monkeypatch):
+    if request.param == "ijson":
+        pytest.importorskip("ijson")
+    else:
+        monkeypatch.setitem(sys.modules, "ijson", None)  # import → ImportError → json.load
+    return request.param
+
+
+@pytest.mark.parametrize("layout", LAYOUTS)
+def test_iter_documents_reads_bytes_without_warnings(tmp_path, parser, layout):
+    path = tmp_path / "index.json"
+    path.write_bytes(b"\n  " + json.dumps(LAYOUTS[layout], ensure_ascii=False).encode("utf-8"))
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")  # ijson cảnh báo DeprecationWarning khi đọc file text mode
+        docs = list(iter_documents(str(path)))
+    expected = {"v2": [("a.pdf", 1, "Thuốc giảm đau")], "ocr": [("scan_page_2.png", 2, "Chống chỉ định")]}[layout]
+    assert [(k, r["pages"][0]["page"], r["pages"][0]["text"]) for k, r in docs] == expected
@@ -0,0 +1,45 @@
+from array import array
+import pytest
+from pdf_index_fields import fields_path, open_field_index, FieldIndex
+from pdf_index_store import save_index
+from pdf_index_words import PageWords, WordCacheWriter, replay, words_path
+
+np = pytest.importorskip("numpy")
+from pdf_index_terms import TermMatrix, terms_path
+
+FP = "0123456789abcdef"
+PAGE_TEXT = ["1. What Promixin is and what it is used for", "Promixin treats pain.",
+             "2. Before you take Promixin", "Do not take Promixin", "if you are allergic to aspirin"]
+
+
+def _page_words():
+    words, boxes = [], array("f")
+    for line_no, line in enumerate(PAGE_TEXT):
+        x = 0.0
+        for word in line.split():
+            words.append(word)
+            boxes.extend((x, 10.0 * line_no, x + 5.0, 10.0 * line_no + 8.0))
+            x += 10.0
+    return PageWords(FP, 1, 595.0, 842.0, tuple(words), boxes)
+
+
+def test_replay_refreshes_term_matrix_and_fields(tmp_path):
+    index_json = str(tmp_path / "index.json")
+    index_data = {"leaflet.pdf": {"_mtime": 1.0, "page_fps": [FP], "pages": [{"page": 1, "text": "stale ocr text"}]}}
+    save_index(index_json, index_data)
+    TermMatrix.from_index(index_data).save(terms_path(index_json))
+    fields = FieldIndex()
+    fields.update_document("leaflet.pdf", 1.0, index_data["leaflet.pdf"]["pages"], [(1, FP, [["a", "b"]])])
+    fields.save(fields_path(index_json))
+    writer = WordCacheWriter(words_path(index_json, "leaflet.pdf"), "leaflet.pdf")
+    writer.add(_page_words())
+    writer.close()
+
+    assert replay(index_json, log=lambda *_: None) == (1, 0)
+
+    terms = TermMatrix.load(terms_path(index_json))
+    assert terms.top_documents(["aspirin"]) == [("leaflet.pdf", 1)]
+    assert terms.top_documents(["stale"]) == []
+    fields = open_field_index(fields_path(index_json))
+    assert [p for p, _, _ in fields.search("contraindications", "aspirin")] == ["leaflet.pdf"]
+    assert len(fields.docs["leaflet.pdf"]["tables"]) == 1  # bảng giữ nguyên